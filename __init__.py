@@ -43,8 +43,8 @@ else:
 
 import bpy
 import os
+import atexit
 from . import addon_updater_ops
-from collections import OrderedDict
 
 
 class GafferPreferences(bpy.types.AddonPreferences):
@@ -120,6 +120,35 @@ class GafferPreferences(bpy.types.AddonPreferences):
             "you'll need to manually refresh the light list when you add or remove lights"
         ),
         default=True,
+        update=functions._update_auto_refresh_light_list,
+    )
+    lights_per_page: bpy.props.IntProperty(
+        name="Lights Per Page",
+        description=(
+            "The maximum number of lights shown at once in the Lights panel. "
+            "Scenes with more lights get a filter and page buttons"
+        ),
+        default=50,
+        min=1,
+        soft_max=500,
+    )
+    hdri_image_cache_size: bpy.props.IntProperty(
+        name="HDRI Image Cache",
+        description=(
+            "How many HDRIs you switched away from are kept in memory, so switching back to them is quick. "
+            "Older ones are removed from the blend file to save memory"
+        ),
+        default=4,
+        min=0,
+        soft_max=20,
+    )
+    hdri_preload_neighbors: bpy.props.BoolProperty(
+        name="Preload Next/Previous HDRI",
+        description=(
+            "After switching HDRIs, load the next and previous HDRIs in the list into memory, "
+            "so that switching to them is instant. Uses more memory"
+        ),
+        default=False,
     )
 
     show_debug: bpy.props.BoolProperty(
@@ -159,7 +188,6 @@ class GafferPreferences(bpy.types.AddonPreferences):
             hdris = functions.get_hdri_list()
             if hdris:
                 num_files = sum(len(x) for x in hdris.values())
-                hdris = OrderedDict(sorted(hdris.items(), key=lambda x: x[0].lower()))
                 num_hdris = len(hdris)
                 row = main_col.row()
                 row.alignment = "RIGHT"
@@ -207,6 +235,9 @@ class GafferPreferences(bpy.types.AddonPreferences):
         col.prop(self, "panel_category")
         col.prop(self, "offline_mode")
         col.prop(self, "auto_refresh_light_list")
+        col.prop(self, "lights_per_page")
+        col.prop(self, "hdri_image_cache_size")
+        col.prop(self, "hdri_preload_neighbors")
 
         addon_updater_ops.update_settings_ui(self, context)
 
@@ -232,8 +263,20 @@ class BlacklistedObject(bpy.types.PropertyGroup):
     name: bpy.props.StringProperty(default="")
 
 
+class GafferLight(bpy.types.PropertyGroup):
+    name: bpy.props.StringProperty(default="")  # Object name
+    material: bpy.props.StringProperty(default="")
+    node: bpy.props.StringProperty(default="")
+    socket: bpy.props.StringProperty(default="")
+
+
 class GafferProperties(bpy.types.PropertyGroup):
-    Lights: bpy.props.StringProperty(name="Lights", default="", description="The objects to include in the isolation")
+    Lights: bpy.props.StringProperty(
+        name="Lights",
+        default="",
+        description="Legacy light list from older versions, replaced by LightList when the list is refreshed",
+    )
+    LightList: bpy.props.CollectionProperty(type=GafferLight)  # must be registered after classes
     ColTempExpand: bpy.props.BoolProperty(
         name="Color Temperature Presets",
         default=False,
@@ -263,6 +306,19 @@ class GafferProperties(bpy.types.PropertyGroup):
         default=False,
         description="Only show lights that are not hidden",
     )
+    LightsFilter: bpy.props.StringProperty(
+        name="Filter",
+        default="",
+        description="Only show lights whose object or data name contains this text",
+        options={"TEXTEDIT_UPDATE"},
+        update=functions._update_lights_filter,
+    )
+    LightsPage: bpy.props.IntProperty(
+        name="Page",
+        default=0,
+        min=0,
+        description="The page of the light list currently shown",
+    )
     WorldVis: bpy.props.BoolProperty(
         name="Hide World lighting",
         default=True,
@@ -413,6 +469,7 @@ class GafferProperties(bpy.types.PropertyGroup):
     Progress: bpy.props.FloatProperty(default=0.0, options={"HIDDEN"})
     ProgressText: bpy.props.StringProperty(default="", options={"HIDDEN"})
     ProgressBarText: bpy.props.StringProperty(default="", options={"HIDDEN"})
+    ProgressCancel: bpy.props.BoolProperty(default=False, options={"HIDDEN"})
     ShowHDRIHaven: bpy.props.BoolProperty(default=False, options={"HIDDEN"})
     ThumbnailsBigHDRIFound: bpy.props.BoolProperty(default=False, options={"HIDDEN"})
     FileNotFoundError: bpy.props.BoolProperty(default=False, options={"HIDDEN"})
@@ -433,6 +490,15 @@ class GafferHDRIProperties(bpy.types.PropertyGroup):
         items=functions.variation_enum_previews,
         update=functions.update_variation,
     )
+    hdri_use_proxy: bpy.props.BoolProperty(
+        name="Viewport Proxy",
+        description=(
+            "Use the smallest variation of the HDRI in the viewport to keep it fast, "
+            "final renders automatically use the biggest variation"
+        ),
+        default=False,
+        update=functions._update_hdri_use_proxy,
+    )
     hdri_search: bpy.props.StringProperty(
         name="Search",
         description="Show only HDRIs matching this text - name, subfolder and tags will match",
@@ -457,7 +523,7 @@ class GafferHDRIProperties(bpy.types.PropertyGroup):
         default=0,
         soft_min=-180,
         soft_max=180,
-        update=functions.update_rotation,
+        update=functions.queue_update(functions.update_rotation),
     )
     hdri_brightness: bpy.props.FloatProperty(
         name="Brightness",
@@ -465,7 +531,7 @@ class GafferHDRIProperties(bpy.types.PropertyGroup):
         default=0,
         soft_min=-10,
         soft_max=10,
-        update=functions.update_brightness,
+        update=functions.queue_update(functions.update_brightness),
     )
     hdri_contrast: bpy.props.FloatProperty(
         name="Contrast",
@@ -473,7 +539,7 @@ class GafferHDRIProperties(bpy.types.PropertyGroup):
         default=1,
         min=0,
         soft_max=2,
-        update=functions.update_contrast,
+        update=functions.queue_update(functions.update_contrast),
     )
     hdri_saturation: bpy.props.FloatProperty(
         name="Saturation",
@@ -481,7 +547,7 @@ class GafferHDRIProperties(bpy.types.PropertyGroup):
         default=1,
         min=0,
         soft_max=2,
-        update=functions.update_saturation,
+        update=functions.queue_update(functions.update_saturation),
     )
     hdri_warmth: bpy.props.FloatProperty(
         name="Warmth",
@@ -489,7 +555,7 @@ class GafferHDRIProperties(bpy.types.PropertyGroup):
         default=1,
         soft_min=0,
         soft_max=2,
-        update=functions.update_warmth,
+        update=functions.queue_update(functions.update_warmth),
     )
     hdri_tint: bpy.props.FloatProperty(
         name="Purple/Green Tint",
@@ -497,7 +563,7 @@ class GafferHDRIProperties(bpy.types.PropertyGroup):
         default=1,
         soft_min=0,
         soft_max=2,
-        update=functions.update_tint,
+        update=functions.queue_update(functions.update_tint),
     )
     hdri_color: bpy.props.FloatVectorProperty(
         name="Mix Color",
@@ -507,7 +573,7 @@ class GafferHDRIProperties(bpy.types.PropertyGroup):
         soft_min=0.0,
         soft_max=1.0,
         default=(0.5, 0.15, 0.075, 0.0),
-        update=functions.update_color,
+        update=functions.queue_update(functions.update_color),
     )
     hdri_horz_shift: bpy.props.FloatProperty(
         name="Horizon Shift",
@@ -515,7 +581,7 @@ class GafferHDRIProperties(bpy.types.PropertyGroup):
         default=0,
         soft_min=0,
         soft_max=1,
-        update=functions.update_horizon,
+        update=functions.queue_update(functions.update_horizon),
     )
     hdri_horz_exp: bpy.props.FloatProperty(
         name="Warp",
@@ -523,7 +589,7 @@ class GafferHDRIProperties(bpy.types.PropertyGroup):
         default=0,
         soft_min=-1,
         soft_max=1,
-        update=functions.update_horizon,
+        update=functions.queue_update(functions.update_horizon),
     )
     hdri_use_jpg_background: bpy.props.BoolProperty(
         name="High-res JPG background",
@@ -560,7 +626,7 @@ class GafferHDRIProperties(bpy.types.PropertyGroup):
         default=0,
         soft_min=-180,
         soft_max=180,
-        update=functions.update_background_rotation,
+        update=functions.queue_update(functions.update_background_rotation),
     )
     hdri_use_separate_brightness: bpy.props.BoolProperty(
         name="Brightness",
@@ -574,7 +640,7 @@ class GafferHDRIProperties(bpy.types.PropertyGroup):
         default=0,
         soft_min=-10,
         soft_max=10,
-        update=functions.update_background_brightness,
+        update=functions.queue_update(functions.update_background_brightness),
     )
     hdri_use_separate_contrast: bpy.props.BoolProperty(
         name="Contrast",
@@ -588,7 +654,7 @@ class GafferHDRIProperties(bpy.types.PropertyGroup):
         default=1,
         min=0,
         soft_max=2,
-        update=functions.update_background_contrast,
+        update=functions.queue_update(functions.update_background_contrast),
     )
     hdri_use_separate_saturation: bpy.props.BoolProperty(
         name="Saturation",
@@ -602,7 +668,7 @@ class GafferHDRIProperties(bpy.types.PropertyGroup):
         default=1,
         min=0,
         soft_max=2,
-        update=functions.update_background_saturation,
+        update=functions.queue_update(functions.update_background_saturation),
     )
     hdri_use_separate_warmth: bpy.props.BoolProperty(
         name="Warmth",
@@ -616,7 +682,7 @@ class GafferHDRIProperties(bpy.types.PropertyGroup):
         default=1,
         soft_min=0,
         soft_max=2,
-        update=functions.update_background_warmth,
+        update=functions.queue_update(functions.update_background_warmth),
     )
     hdri_use_separate_tint: bpy.props.BoolProperty(
         name="Tint",
@@ -630,7 +696,7 @@ class GafferHDRIProperties(bpy.types.PropertyGroup):
         default=1,
         soft_min=0,
         soft_max=2,
-        update=functions.update_background_tint,
+        update=functions.queue_update(functions.update_background_tint),
     )
     hdri_use_separate_color: bpy.props.BoolProperty(
         name="Mix Color",
@@ -646,7 +712,7 @@ class GafferHDRIProperties(bpy.types.PropertyGroup):
         soft_min=0.0,
         soft_max=1.0,
         default=(0.5, 0.15, 0.075, 0.0),
-        update=functions.update_background_color,
+        update=functions.queue_update(functions.update_background_color),
     )
     hdri_clamp: bpy.props.FloatProperty(
         name="Clamp Brightness",
@@ -665,6 +731,17 @@ class GafferHDRIProperties(bpy.types.PropertyGroup):
         description="Generate the JPG and darkened JPG for all HDRIs that you have. This will probably take a while",
         default=False,
     )
+    hdri_jpg_max_width: bpy.props.IntProperty(
+        name="Max Width",
+        description=(
+            "Scale the JPGs down to this width when the HDRI is bigger, which makes generating them faster "
+            "and uses less memory. Disabled when on 0"
+        ),
+        default=0,
+        min=0,
+        soft_max=16384,
+        subtype="PIXEL",
+    )
     hdri_show_tags_ui: bpy.props.BoolProperty(
         name="Tags",
         description="Choose some tags for this HDRI to help you search for it later",
@@ -684,6 +761,7 @@ class GafferHDRIProperties(bpy.types.PropertyGroup):
 classes = [
     GafferPreferences,
     BlacklistedObject,
+    GafferLight,
     GafferProperties,
     GafferHDRIProperties,
     operators.GAFFER_OT_rename,
@@ -699,6 +777,7 @@ classes = [
     operators.GAFFER_OT_light_use_nodes,
     operators.GAFFER_OT_node_set_strength,
     operators.GAFFER_OT_refresh_light_list,
+    operators.GAFFER_OT_lights_page,
     operators.GAFFER_OT_set_light_data_user_names,
     operators.GAFFER_OT_apply_exposure,
     operators.GAFFER_OT_link_sky_to_sun,
@@ -715,6 +794,7 @@ classes = [
     operators.GAFFER_OT_hdri_path_remove,
     operators.GAFFER_OT_hdri_thumb_gen,
     operators.GAFFER_OT_hdri_jpg_gen,
+    operators.GAFFER_OT_cancel_progress,
     operators.GAFFER_OT_hdri_clear_search,
     operators.GAFFER_OT_hdri_set_favorite,
     operators.GAFFER_OT_hdri_set_folder_filter,
@@ -756,6 +836,15 @@ def register():
     bpy.types.World.gaf_hdri_props = bpy.props.PointerProperty(type=GafferHDRIProperties)
     bpy.app.handlers.load_post.append(operators.load_handler)
     bpy.app.handlers.depsgraph_update_post.append(functions.depsgraph_update_post_handler)
+    bpy.app.handlers.undo_post.append(functions.undo_redo_post_handler)
+    bpy.app.handlers.redo_post.append(functions.undo_redo_post_handler)
+    bpy.app.handlers.render_pre.append(functions.flush_queued_updates)  # Before proxy_render_pre, may change the HDRI
+    bpy.app.handlers.render_pre.append(functions.proxy_render_pre)
+    bpy.app.handlers.render_complete.append(functions.proxy_render_post)
+    bpy.app.handlers.render_cancel.append(functions.proxy_render_post)
+    atexit.register(functions.flush_json_files, False)  # Blender doesn't unregister add-ons when quitting
+    functions.update_hdri_haven_list()  # Fetched in the background, Blender shouldn't wait on the network to start
+    bpy.app.timers.register(functions.prepare_proxy_renders, first_interval=0)  # bpy.data isn't available yet
 
 
 def unregister():
@@ -763,6 +852,27 @@ def unregister():
 
     bpy.app.handlers.load_post.remove(operators.load_handler)
     bpy.app.handlers.depsgraph_update_post.remove(functions.depsgraph_update_post_handler)
+    bpy.app.handlers.undo_post.remove(functions.undo_redo_post_handler)
+    bpy.app.handlers.redo_post.remove(functions.undo_redo_post_handler)
+    bpy.app.handlers.render_pre.remove(functions.flush_queued_updates)
+    bpy.app.handlers.render_pre.remove(functions.proxy_render_pre)
+    bpy.app.handlers.render_complete.remove(functions.proxy_render_post)
+    bpy.app.handlers.render_cancel.remove(functions.proxy_render_post)
+
+    if bpy.app.timers.is_registered(functions.prepare_proxy_renders):
+        bpy.app.timers.unregister(functions.prepare_proxy_renders)
+    if bpy.app.timers.is_registered(functions.preload_neighbor_hdris):
+        bpy.app.timers.unregister(functions.preload_neighbor_hdris)
+    if bpy.app.timers.is_registered(functions.apply_queued_updates):
+        bpy.app.timers.unregister(functions.apply_queued_updates)
+    constants.queued_updates.clear()
+    if bpy.app.timers.is_registered(functions.apply_hdri_haven_list):
+        bpy.app.timers.unregister(functions.apply_hdri_haven_list)
+    constants.hdri_haven_fetch = None
+    if bpy.app.timers.is_registered(functions.flush_json_files):
+        bpy.app.timers.unregister(functions.flush_json_files)
+    functions.flush_json_files(wait=False)
+    atexit.unregister(functions.flush_json_files)
 
     functions.previews_unregister()
 
@@ -129,8 +129,13 @@ jpg_dir = os.path.join(data_dir, "hdri_jpgs")
 if not os.path.exists(jpg_dir):
     os.makedirs(jpg_dir)
 hdri_list_path = os.path.join(data_dir, "gaffer_hdris.json")
+hdri_manifest_path = os.path.join(data_dir, "gaffer_hdris_manifest.json")
+hdri_manifest = {}  # See functions.scan_hdri_folder
+hdri_fingerprints = {}  # See functions.get_hdri_fingerprints
+hdri_variation_info = {}  # See functions.get_variation_info
+thumbnail_index_path = os.path.join(data_dir, "thumbnails.json")
 tags_path = os.path.join(data_dir, "tags.json")
-favorites = {}
+favorites = {}  # Cached set of favorite HDRI names, see functions.get_favorites
 favorites_path = os.path.join(data_dir, "favorites.json")
 defaults_path = os.path.join(data_dir, "hdri_defaults.json")
 defaults_stored = [
@@ -160,9 +165,10 @@ defaults_stored = [
 settings_file = os.path.join(data_dir, "settings.json")
 preview_collections = {}
 icon_dir = os.path.join(os.path.dirname(__file__), "icons")
-hdri_list = {}
+hdri_list = {}  # Same as hdri_catalog["hdris"]
 hdri_haven_list = []
 hdri_haven_list_path = os.path.join(data_dir, "hdri_haven_hdris.json")
+hdri_haven_fetch = None  # Background download in progress, see functions.update_hdri_haven_list
 custom_icons = None
 default_tags = [
     "outdoor",
@@ -190,6 +196,22 @@ default_tags = [
     "##split##",
 ]
 possible_tags = []
+light_registry = {}  # Scene pointer -> index of that scene's light list, see functions.light_registry
+light_draw_model = {}  # Scene pointer -> prepared records for the Lights panel, see functions.light_draw_model
+world_node_maps = {}  # Node tree pointer -> {node name: node}, see functions.world_node_map
+hdri_graph_state = {}  # Node tree pointer -> the HDRI handler graph last set up in it, see functions.setup_hdri
+queued_updates = {}  # update_* function -> property group it was called for, see functions.queue_update
+handler_images = {}  # Image path -> name of the image loaded for it, oldest first, see functions.evict_handler_images
+proxy_images = {}  # World name -> image to render with instead of the proxy, see functions.prepare_proxy_render
+proxy_swaps = {}  # World name -> proxy image to restore after rendering, see functions.proxy_render_pre
+auto_refresh_light_list = None  # Cached preference, see functions.auto_refresh_light_list
+tag_index = {}  # Cached tag -> HDRI names index, see functions.get_tag_index
+tags_version = 0  # Incremented whenever tags are changed in place
+hdri_search_index = {}  # See functions.get_hdri_search_index
+hdri_catalog = {}  # In-memory HDRI list, see functions.load_hdri_catalog
+hdri_search_results = {}  # Cached filtered HDRI list, see functions.get_hdri_list
+favorites_version = 0  # Incremented whenever the favorites change
+json_cache = {}  # File path -> cached contents of that JSON file, see functions.read_json_cached
 
 # List of types from: https://docs.blender.org/api/current/bpy_types_enum_items/id_type_items.html
 depsgraph_id_types = [
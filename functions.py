@@ -18,9 +18,13 @@
 
 import bpy
 import json
+import copy
+import hashlib
 from gpu_extras.batch import batch_for_shader
 import os
 import math
+import bisect
+import struct
 import time
 import datetime
 from collections import OrderedDict
@@ -32,63 +36,122 @@ from . import constants as const
 TAG_REFRESH_LIGHT_LIST = False
 
 
+# Cached JSON files
+
+JSON_RECHECK_INTERVAL = 2  # Seconds before checking again whether a cached file was changed on disk
+JSON_WRITE_DELAY = 1  # Seconds without further changes before a changed file is written
+
+
+def read_json_cached(path):
+    """Return the contents of a JSON file (a dict), only reading it again when it was changed on disk.
+
+    The same dict is returned to every caller, so after changing it call write_json_later.
+    """
+    entry = const.json_cache.get(path)
+    now = time.monotonic()
+    if entry is not None and (entry["dirty"] or now - entry["checked"] < JSON_RECHECK_INTERVAL):
+        return entry["data"]
+
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        mtime = None
+    if entry is None or mtime != entry["mtime"]:
+        data = {}
+        if mtime is not None:
+            with open(path) as f:
+                try:
+                    data = json.load(f)
+                except json.JSONDecodeError:
+                    data = {}
+        entry = {"data": data, "mtime": mtime, "dirty": False, "changed": 0}
+        const.json_cache[path] = entry
+    entry["checked"] = now
+    return entry["data"]
+
+
+def write_json_later(path, data=None):
+    """Mark a cached JSON file as changed, it will be written once it stops changing for JSON_WRITE_DELAY"""
+    entry = const.json_cache.get(path)
+    if entry is None:
+        entry = {"data": {}, "mtime": None, "checked": time.monotonic()}
+        const.json_cache[path] = entry
+    if data is not None:
+        entry["data"] = data
+    entry["dirty"] = True
+    entry["changed"] = time.monotonic()
+    if not bpy.app.timers.is_registered(flush_json_files):
+        bpy.app.timers.register(flush_json_files, first_interval=JSON_WRITE_DELAY, persistent=True)
+
+
+def write_json_atomic(path, data, indent=4):
+    """Write to a temporary file first so that a crash never leaves a half-written file behind"""
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as f:
+        f.write(json.dumps(data, indent=indent))
+    os.replace(temp_path, path)
+
+
+def flush_json_files(wait=True):
+    """Write all changed cached JSON files. Used as a timer, returns how long to wait if some are still changing"""
+    now = time.monotonic()
+    if wait:
+        remaining = [e["changed"] + JSON_WRITE_DELAY - now for e in const.json_cache.values() if e["dirty"]]
+        if remaining and max(remaining) > 0:
+            return max(remaining)
+
+    for path, entry in const.json_cache.items():
+        if entry["dirty"]:
+            try:
+                write_json_atomic(path, entry["data"])
+                entry["mtime"] = os.path.getmtime(path)
+            except OSError as e:
+                log(f"Failed to write {path}: {e}", also_print=True)
+            entry["dirty"] = False
+            entry["checked"] = now
+    return None
+
+
 # Persistent settings functions
 
 
 def init_persistent_settings(set_name=None, set_value=None):
     """Initialize persistent settings file with option to change a default value"""
 
-    settings = {}
-
-    # Some settings might already exist
-    if os.path.exists(const.settings_file):
-        with open(const.settings_file) as f:
-            try:
-                settings = json.load(f)
-            except json.JSONDecodeError:
-                settings = {}
+    settings = read_json_cached(const.settings_file)
+    changed = False
 
     # First time use in 2.8, copy path from 2.7
     if "hdri_paths" not in settings and "hdri_path" in settings:
         settings["hdri_paths"] = [settings["hdri_path"]]
+        changed = True
 
     defaults = {"show_hdri_haven": True, "hdri_path": "", "hdri_paths": [""]}  # Legacy
     for d in defaults:
         if d not in settings:
             settings[d] = defaults[d]
+            changed = True
 
     if set_name is not None:
         settings[set_name] = set_value
+        changed = True
 
-    with open(const.settings_file, "w") as f:
-        f.write(json.dumps(settings, indent=4))
+    if changed:
+        write_json_later(const.settings_file)
 
     return settings
 
 
 def get_persistent_setting(name):
-    if os.path.exists(const.settings_file):
-        with open(const.settings_file) as f:
-            try:
-                settings = json.load(f)
-            except json.JSONDecodeError:
-                settings = {}
-        if name in settings:
-            return settings[name]
-
-    initial_settings = init_persistent_settings()
-    return initial_settings[name] if name in initial_settings else None
+    settings = read_json_cached(const.settings_file)
+    if name not in settings:
+        settings = init_persistent_settings()
+    # Callers may change lists in place before setting them, don't let that change the cache
+    return copy.deepcopy(settings.get(name))
 
 
 def set_persistent_setting(name, value):
-    if not os.path.exists(const.settings_file):
-        init_persistent_settings(name, value)
-    else:
-        with open(const.settings_file) as f:
-            settings = json.load(f)
-        settings[name] = value
-        with open(const.settings_file, "w") as f:
-            f.write(json.dumps(settings, indent=4))
+    init_persistent_settings(name, value)
 
 
 # Utils
@@ -169,38 +232,215 @@ def time_execution(func):
 # Light list functions
 
 
-@time_execution
-def refresh_light_list(scene):
-    def get_next_available_value_socket(node):
-        current_node = node
-        found_node = node.name
-        found_socket = -1
-        i = 0
-        max_iterations = 1000  # Prevent infinite loop
-        while found_socket == -1:
-            i += 1
-            if i == max_iterations:
-                print("Gaffer Warning: Max iterations hit in get_next_available_value_socket for " + node.name)
-                break
-            if len(current_node.inputs) == 0:
-                # End of the line.
-                break
+def invalidate_light_registry():
+    const.light_registry.clear()
+    const.light_draw_model.clear()  # Built from the registry
 
-            for si, s in enumerate(current_node.inputs):
-                if s.type == "VALUE":
-                    if not s.is_linked:
-                        found_node = current_node.name
-                        found_socket = si
-                        break
-                    else:
-                        current_node = s.links[0].from_node
-        return found_node, found_socket
 
-    global TAG_REFRESH_LIGHT_LIST
-    TAG_REFRESH_LIGHT_LIST = False
+def light_registry(scene):
+    """Return the in-memory index of scene.gaf_props.LightList, only rebuilding it when the list has changed.
+
+    Each light is a list of [object name, material name, node name, socket] (None where not applicable),
+    and the same list objects are shared by all the lookup tables:
+        "lights":      all lights in the order they are displayed
+        "by_object":   object name -> light
+        "by_pointer":  object pointer -> light
+        "by_material": material name -> list of lights using it
+        "by_node":     (material name, or object name for lights, node name) -> light
+    """
+    light_list = scene.gaf_props.LightList
+    registry = const.light_registry.get(scene.as_pointer())
+    if registry is not None and len(registry["lights"]) == len(light_list):
+        return registry
+
+    registry = {"lights": [], "by_object": {}, "by_pointer": {}, "by_material": {}, "by_node": {}}
+    for item in light_list:
+        light = [item.name, item.material or None, item.node or None, item.socket or None]
+        registry["lights"].append(light)
+        registry["by_object"][item.name] = light
+        obj = bpy.data.objects.get(item.name)
+        if obj is not None:
+            registry["by_pointer"][obj.as_pointer()] = light
+        if light[1]:
+            registry["by_material"].setdefault(light[1], []).append(light)
+        if light[2]:
+            registry["by_node"][(light[1] or light[0], light[2])] = light
+    const.light_registry[scene.as_pointer()] = registry
+    return registry
+
+
+def set_light_list(scene, lights):
+    light_list = scene.gaf_props.LightList
+    light_list.clear()
+    for light in lights:
+        item = light_list.add()
+        item.name = light[0]
+        item.material = light[1] or ""
+        item.node = light[2] or ""
+        item.socket = light[3] or ""
+    if scene.gaf_props.Lights:
+        scene.gaf_props.Lights = ""  # Superseded by LightList, only kept to read old files
+    invalidate_light_registry()
+
+
+def invalidate_light_draw_model():
+    const.light_draw_model.clear()
+
+
+def light_draw_model(scene):
+    """Return what the Lights panel needs to draw each light, only rebuilding it when the light list, the panel
+    filters or the scene itself has changed (the depsgraph handler invalidates it for anything but transforms).
+
+    Returns a dict with "records", one per light to show (lights sharing the same data are only shown once):
+        "object", "material", "node_strength", "node_color": the datablocks/nodes to draw (None if not used)
+        "socket_type", "socket_index": the strength socket on node_strength, see split_socket
+        "users": [data key, number of lights sharing that data]
+        "uses_nodes", "is_portal"
+    and "out_of_date", True if some light in the list no longer exists.
+    """
+    gaf_props = scene.gaf_props
+    registry = light_registry(scene)
+    filters = (
+        scene.render.engine,
+        gaf_props.VisibleLightsOnly,
+        gaf_props.VisibleCollectionsOnly,
+        tuple(o.name for o in gaf_props.Blacklist),
+    )
+    model = const.light_draw_model.get(scene.as_pointer())
+    if model is not None and model["registry"] is registry and model["filters"] == filters:
+        return model
+
+    model = {"registry": registry, "filters": filters, "records": [], "out_of_date": False}
+    vis_cols = visibleCollections()
+    blacklist = set(filters[3])
+    duplicates = {}  # object type + data name (cannot use only the name in case of conflicts) -> users
+    for light in registry["lights"]:
+        try:
+            # Will cause KeyError exception if obj no longer exists
+            obj = bpy.data.objects[light[0]]
+            if gaf_props.VisibleLightsOnly and obj.hide_viewport:
+                continue
+            material = None
+            node_strength = None
+            if obj.type != "LIGHT":
+                material = bpy.data.materials[light[1] or ""]
+                uses_nodes = material.use_nodes
+                if uses_nodes:
+                    node_strength = material.node_tree.nodes[light[2] or ""]
+            else:
+                uses_nodes = obj.data.use_nodes
+                if uses_nodes:
+                    node_strength = obj.data.node_tree.nodes[light[2] or ""]
+        except KeyError:
+            model["out_of_date"] = True
+            continue
+        if gaf_props.VisibleCollectionsOnly and not isInVisibleCollection(obj, vis_cols):
+            continue
+        if obj.name in blacklist:
+            continue
+
+        # Don't show lights that share the same data
+        key = "LIGHT" + obj.data.name if obj.type == "LIGHT" else "MAT" + material.name
+        if key in duplicates:
+            duplicates[key][1] += 1
+            continue
+        duplicates[key] = [key, 1]
+
+        is_portal = (
+            obj.type == "LIGHT"
+            and obj.data.type == "AREA"
+            and obj.data.cycles.is_portal
+            and scene.render.engine == "CYCLES"
+        )
+        socket_type, socket_index = split_socket(light[3]) if uses_nodes else (None, None)
+
+        node_color = None
+        if uses_nodes and scene.render.engine == "CYCLES":
+            nodes = obj.data.node_tree.nodes if obj.type == "LIGHT" else material.node_tree.nodes
+            # Use the right-most linked Emission shader
+            emissions = [n for n in nodes if n.type == "EMISSION" and n.outputs[0].is_linked]
+            if emissions:
+                node_color = max(emissions, key=lambda x: x.location.x)
+
+        model["records"].append(
+            {
+                "object": obj,
+                "material": material,
+                "node_strength": node_strength,
+                "node_color": node_color,
+                "socket_type": socket_type,
+                "socket_index": socket_index,
+                "users": duplicates[key],
+                "uses_nodes": uses_nodes,
+                "is_portal": is_portal,
+            }
+        )
+    const.light_draw_model[scene.as_pointer()] = model
+    return model
+
+
+def filter_light_records(scene, records):
+    """Only keep the light_draw_model records whose object or data name contains the Lights panel filter"""
+    text = scene.gaf_props.LightsFilter.lower()
+    if not text:
+        return records
+    return [
+        r
+        for r in records
+        if text in r["object"].name.lower() or text in (r["material"] or r["object"].data).name.lower()
+    ]
+
+
+def light_page_count(num_lights):
+    prefs = bpy.context.preferences.addons[__package__].preferences
+    return max(1, math.ceil(num_lights / prefs.lights_per_page))
 
-    detected_lights = []
 
+def _update_lights_filter(self, context):
+    self.LightsPage = 0
+
+
+@persistent
+def undo_redo_post_handler(*args):
+    # Undo restores LightList without telling us, so don't trust anything built from it before.
+    invalidate_light_registry()
+    const.world_node_maps.clear()  # Node trees may have been reallocated
+    const.hdri_graph_state.clear()
+    # Node values are set by a timer after the undo step of a change is pushed (see queue_update), so that step can
+    # hold old node values with the new property values. Set them all again from the restored properties
+    const.queued_updates.clear()
+    world = bpy.context.scene.world
+    if world is not None:
+        setup_hdri(world.gaf_hdri_props, bpy.context)
+
+
+def get_next_available_value_socket(node):
+    current_node = node
+    found_node = node.name
+    found_socket = -1
+    i = 0
+    max_iterations = 1000  # Prevent infinite loop
+    while found_socket == -1:
+        i += 1
+        if i == max_iterations:
+            print("Gaffer Warning: Max iterations hit in get_next_available_value_socket for " + node.name)
+            break
+        if len(current_node.inputs) == 0:
+            # End of the line.
+            break
+
+        for si, s in enumerate(current_node.inputs):
+            if s.type == "VALUE":
+                if not s.is_linked:
+                    found_node = current_node.name
+                    found_socket = si
+                    break
+                else:
+                    current_node = s.links[0].from_node
+    return found_node, found_socket
+
+
+def register_falloff_property():
     if not hasattr(bpy.types.Object, "GafferFalloff"):
         bpy.types.Object.GafferFalloff = bpy.props.EnumProperty(
             name="Light Falloff",
@@ -226,145 +466,137 @@ def refresh_light_list(scene):
             update=_update_falloff,
         )
 
+
+def detect_light_node(obj, material_name, nodes, light_dict):
+    """Find the node/socket controlling the strength of obj in a node tree, reusing the previously found node if valid"""
+    known_node = light_dict.get(obj.name)  # None if unknown or previously did not use nodes (like default light)
+    if known_node is None or known_node not in nodes:
+        for node in nodes:
+            if node.name != "Emission Viewer":
+                if node.type == "EMISSION":
+                    if node.outputs[0].is_linked:
+                        node_name, socket_index = get_next_available_value_socket(node)
+                        return [obj.name, material_name, node_name, "i" + str(socket_index)]
+        return None
+
+    node = nodes[known_node]
+    if node.inputs:
+        node_name, socket_index = get_next_available_value_socket(node)
+        return [obj.name, material_name, node_name, "i" + str(socket_index)]
+    for socket_index, oupt in enumerate(node.outputs):
+        if oupt.type == "VALUE":  # use first Value socket as strength
+            return [obj.name, material_name, node.name, "o" + str(socket_index)]
+    return None
+
+
+def detect_light(scene, obj, light_dict):
+    """Return the light list entry for obj, or None if it isn't a light"""
+    if scene.render.engine not in ["CYCLES", "BLENDER_EEVEE", "BLENDER_EEVEE_NEXT"]:  # Unsupported engines
+        return [obj.name, None, None, None] if obj.type == "LIGHT" else None
+
+    if obj.type == "LIGHT":
+        if obj.data.use_nodes:
+            return detect_light_node(obj, None, obj.data.node_tree.nodes, light_dict)
+        return [obj.name, None, None, None]
+    elif obj.type == "MESH" and len(obj.material_slots) > 0 and scene.render.engine == "CYCLES":
+        for slot in obj.material_slots:
+            if slot.material and slot.material.use_nodes:
+                light = detect_light_node(obj, slot.material.name, slot.material.node_tree.nodes, light_dict)
+                if light:
+                    return light  # only use first emission material in slots
+    return None
+
+
+def check_light_falloff(light):
+    obj = bpy.data.objects[light[0]]
+    nodes = None
+    if obj.type == "LIGHT":
+        if obj.data.use_nodes:
+            nodes = obj.data.node_tree.nodes
+    else:
+        if bpy.data.materials[light[1]].use_nodes:
+            nodes = bpy.data.materials[light[1]].node_tree.nodes
+    if nodes:
+        if light[2]:
+            if nodes[light[2]].type != "LIGHT_FALLOFF" and obj.GafferFalloff != "quadratic":
+                obj.GafferFalloff = "quadratic"
+
+
+@time_execution
+def refresh_light_list(scene):
+    global TAG_REFRESH_LIGHT_LIST
+    TAG_REFRESH_LIGHT_LIST = False
+
+    register_falloff_property()
+
     light_dict = dictOfLights()
 
-    objects = sorted(scene.objects, key=lambda x: x.name)
-
-    if scene.render.engine in ["CYCLES", "BLENDER_EEVEE", "BLENDER_EEVEE_NEXT"]:
-        for obj in objects:
-            light_mats = []
-            if obj.type == "LIGHT":
-                if obj.data.use_nodes:
-                    invalid_node = False
-                    if obj.name in light_dict:
-                        if light_dict[obj.name] == "None":  # Previously did not use nodes (like default light)
-                            invalid_node = True
-                        elif light_dict[obj.name] not in obj.data.node_tree.nodes:
-                            invalid_node = True
-                    if obj.name not in light_dict or invalid_node:
-                        for node in obj.data.node_tree.nodes:
-                            if node.name != "Emission Viewer":
-                                if node.type == "EMISSION":
-                                    if node.outputs[0].is_linked:
-                                        (
-                                            node_name,
-                                            socket_index,
-                                        ) = get_next_available_value_socket(node)
-                                        detected_lights.append(
-                                            [
-                                                obj.name,
-                                                None,
-                                                node_name,
-                                                "i" + str(socket_index),
-                                            ]
-                                        )
-                                        break
-                    else:
-                        node = obj.data.node_tree.nodes[light_dict[obj.name]]
-                        if node.inputs:
-                            node_name, socket_index = get_next_available_value_socket(node)
-                            detected_lights.append([obj.name, None, node_name, "i" + str(socket_index)])
-                        elif node.outputs:
-                            socket_index = 0
-                            for oupt in node.outputs:
-                                if oupt.type == "VALUE":  # use first Value socket as strength
-                                    detected_lights.append(
-                                        [
-                                            obj.name,
-                                            None,
-                                            node.name,
-                                            "o" + str(socket_index),
-                                        ]
-                                    )
-                                    break
-                                socket_index += 1
-                else:
-                    detected_lights.append([obj.name, None, None])
-            elif obj.type == "MESH" and len(obj.material_slots) > 0 and scene.render.engine == "CYCLES":
-                slot_break = False
-                for slot in obj.material_slots:
-                    if slot_break:
-                        break  # only use first emission material in slots
-                    if slot.material:
-                        if slot.material not in light_mats:
-                            if slot.material.use_nodes:
-                                invalid_node = False
-                                if obj.name in light_dict:
-                                    if light_dict[obj.name] == "None":  # Previously did not use nodes
-                                        invalid_node = True
-                                    elif light_dict[obj.name] not in slot.material.node_tree.nodes:
-                                        invalid_node = True
-                                if obj.name not in light_dict or invalid_node:
-                                    for node in slot.material.node_tree.nodes:
-                                        if node.name != "Emission Viewer":
-                                            if node.type == "EMISSION":
-                                                if node.outputs[0].is_linked:
-                                                    (
-                                                        node_name,
-                                                        socket_index,
-                                                    ) = get_next_available_value_socket(node)
-                                                    detected_lights.append(
-                                                        [
-                                                            obj.name,
-                                                            slot.material.name,
-                                                            node_name,
-                                                            "i" + str(socket_index),
-                                                        ]
-                                                    )
-                                                    light_mats.append(slot.material)  # Skip this material next time
-                                                    slot_break = True
-                                                    break
-                                else:
-                                    node = slot.material.node_tree.nodes[light_dict[obj.name]]
-                                    if node.inputs:
-                                        (
-                                            node_name,
-                                            socket_index,
-                                        ) = get_next_available_value_socket(node)
-                                        detected_lights.append(
-                                            [
-                                                obj.name,
-                                                slot.material.name,
-                                                node_name,
-                                                "i" + str(socket_index),
-                                            ]
-                                        )
-                                    elif node.outputs:
-                                        socket_index = 0
-                                        for oupt in node.outputs:
-                                            if oupt.type == "VALUE":  # use first Value socket as strength
-                                                detected_lights.append(
-                                                    [
-                                                        obj.name,
-                                                        slot.material.name,
-                                                        node.name,
-                                                        "o" + str(socket_index),
-                                                    ]
-                                                )
-                                                break
-                                            socket_index += 1
-    else:  # Unsupported engines
-        for obj in objects:
-            if obj.type == "LIGHT":
-                detected_lights.append([obj.name, None, None])
+    detected_lights = []
+    for obj in sorted(scene.objects, key=lambda x: x.name):
+        light = detect_light(scene, obj, light_dict)
+        if light:
+            detected_lights.append(light)
 
     for light in detected_lights:
-        obj = bpy.data.objects[light[0]]
-        nodes = None
-        if obj.type == "LIGHT":
-            if obj.data.use_nodes:
-                nodes = obj.data.node_tree.nodes
+        check_light_falloff(light)
+    set_light_list(scene, detected_lights)
+
+    if scene.gaf_props.SoloActive == "":
+        getHiddenStatus(scene, detected_lights)
+    if bpy.context.area:
+        refresh_bgl()  # update the radius/label as well
+
+
+@time_execution
+def update_light_list(scene, depsgraph):
+    """Re-detect only the objects mentioned in depsgraph.updates and patch the light list in place"""
+    registry = light_registry(scene)
+
+    changed = set()
+    for update in depsgraph.updates:
+        datablock = update.id.original
+        if isinstance(datablock, bpy.types.Object):
+            changed.add(datablock.name)
+        elif isinstance(datablock, bpy.types.Material):
+            changed.update(light[0] for light in registry["by_material"].get(datablock.name, []))
+        elif isinstance(datablock, bpy.types.Light):
+            for light in registry["lights"]:
+                obj = bpy.data.objects.get(light[0])
+                if obj is not None and obj.data == datablock:
+                    changed.add(light[0])
+    # Deleted objects don't appear in the updates
+    changed.update(light[0] for light in registry["lights"] if light[0] not in scene.objects)
+    if not changed:
+        return
+
+    register_falloff_property()
+
+    light_dict = dictOfLights()
+    light_list = scene.gaf_props.LightList
+    for name in sorted(changed):
+        obj = scene.objects.get(name)
+        light = detect_light(scene, obj, light_dict) if obj is not None else None
+        index = light_list.find(name)
+        if light is None:
+            if index != -1:
+                light_list.remove(index)
+            continue
+
+        if index == -1:
+            names = [item.name for item in light_list]
+            item = light_list.add()
+            item.name = name
+            light_list.move(len(light_list) - 1, bisect.bisect(names, name))  # Keep sorted by name
         else:
-            if bpy.data.materials[light[1]].use_nodes:
-                nodes = bpy.data.materials[light[1]].node_tree.nodes
-        if nodes:
-            if light[2]:
-                if nodes[light[2]].type != "LIGHT_FALLOFF" and bpy.data.objects[light[0]].GafferFalloff != "quadratic":
-                    bpy.data.objects[light[0]].GafferFalloff = "quadratic"
-    scene.gaf_props.Lights = str(detected_lights)
+            item = light_list[index]
+        item.material = light[1] or ""
+        item.node = light[2] or ""
+        item.socket = light[3] or ""
+        check_light_falloff(light)
+    invalidate_light_registry()
 
     if scene.gaf_props.SoloActive == "":
-        getHiddenStatus(scene, stringToNestedList(scene.gaf_props.Lights, True))
+        getHiddenStatus(scene, light_registry(scene)["lights"])
     if bpy.context.area:
         refresh_bgl()  # update the radius/label as well
 
@@ -539,68 +771,63 @@ def isInVisibleCollection(obj, vis_cols):
 
 def dictOfLights():
     # Create dict of light name as key with node name as value
-    lights = stringToNestedList(bpy.context.scene.gaf_props.Lights, stripquotes=True)
-    lights_with_nodes = []
-    light_dict = {}
-    if lights:
-        for light in lights:  # TODO check if node still exists
-            if len(light) > 1:
-                lights_with_nodes.append(light[0])
-                lights_with_nodes.append(light[2])
-        light_dict = dict(lights_with_nodes[i : i + 2] for i in range(0, len(lights_with_nodes), 2))
-    return light_dict
+    scene = bpy.context.scene
+    if not scene.gaf_props.LightList and scene.gaf_props.Lights:
+        # Files saved with older versions stored the light list as a string, which is replaced on the next refresh
+        lights = stringToNestedList(scene.gaf_props.Lights, stripquotes=True)
+        return {light[0]: (None if light[2] == "None" else light[2]) for light in lights if len(light) > 2}
+    return {name: light[2] for name, light in light_registry(scene)["by_object"].items()}
 
 
 def setGafferNode(context, nodetype, tree=None, obj=None):
-    if nodetype == "STRENGTH":
-        list_nodeindex = 2
-        list_socketindex = 3
-    elif nodetype == "COLOR":
-        list_nodeindex = 4
-        list_socketindex = 5
+    if nodetype != "STRENGTH":
+        return  # Only the strength node is stored in the light list
 
     if tree:
         nodetree = tree
     else:
         nodetree = context.space_data.node_tree
     node = nodetree.nodes.active
-    lights = stringToNestedList(context.scene.gaf_props.Lights, stripquotes=True)
 
     if obj is None:
         obj = context.object
-    for light in lights:
-        # TODO poll for pinned nodetree (active object is not necessarily the one that this tree belongs to)
-        if light[0] == obj.name:
-            light[list_nodeindex] = node.name
-            socket_index = 0
-
-            if node.inputs:
-                for socket in node.inputs:
-                    if socket.type == "VALUE" and not socket.is_linked:  # use first Value socket as strength
-                        light[list_socketindex] = "i" + str(socket_index)
-                        break
-                    socket_index += 1
+    # TODO poll for pinned nodetree (active object is not necessarily the one that this tree belongs to)
+    item = context.scene.gaf_props.LightList.get(obj.name)
+    if item is None:
+        return
+
+    item.node = node.name
+    socket_index = 0
+    if node.inputs:
+        for socket in node.inputs:
+            if socket.type == "VALUE" and not socket.is_linked:  # use first Value socket as strength
+                item.socket = "i" + str(socket_index)
                 break
-            elif node.outputs:
-                for socket in node.outputs:
-                    if socket.type == "VALUE":  # use first Value socket as strength
-                        light[list_socketindex] = "o" + str(socket_index)
-                        break
-                    socket_index += 1
+            socket_index += 1
+    elif node.outputs:
+        for socket in node.outputs:
+            if socket.type == "VALUE":  # use first Value socket as strength
+                item.socket = "o" + str(socket_index)
                 break
+            socket_index += 1
     # TODO catch if there is no available socket to use
-    context.scene.gaf_props.Lights = str(lights)
+    invalidate_light_registry()
+
+
+def split_socket(socket):
+    """Split a stored socket like "i2" or "o0" into its type ("i" for inputs, "o" for outputs) and index"""
+    if socket.startswith("o") or socket.startswith("i"):
+        return socket[0], int(socket[1:])
+    return "i", int(socket)
 
 
 def do_update_falloff(self):
     light = self
     scene = bpy.context.scene
-    lights = stringToNestedList(scene.gaf_props.Lights, stripquotes=True)
-    lightitems = []
-    for l in lights:
-        if l[0] == light.name:
-            lightitems = l
-            break
+    lightitems = light_registry(scene)["by_object"].get(light.name)
+    if lightitems is None:
+        print("Warning: do_update_falloff failed, light is not in the light list")
+        return
 
     socket_no = 2
     falloff = light.GafferFalloff
@@ -627,14 +854,14 @@ def do_update_falloff(self):
         else:
             if light.GafferFalloff != "quadratic":
                 fnode = tree.nodes.new("ShaderNodeLightFalloff")
-                fnode.inputs[0].default_value = node.inputs[int(str(lightitems[3])[-1])].default_value
+                fnode.inputs[0].default_value = node.inputs[split_socket(lightitems[3])[1]].default_value
                 fnode.location.x = node.location.x - 250
                 fnode.location.y = node.location.y
-                tree.links.new(fnode.outputs[socket_no], node.inputs[int(str(lightitems[3])[-1])])
+                tree.links.new(fnode.outputs[socket_no], node.inputs[split_socket(lightitems[3])[1]])
                 tree.nodes.active = fnode
                 setGafferNode(bpy.context, "STRENGTH", tree, light)
         force_update(bpy.context, light)
-    except (KeyError, IndexError, AttributeError):
+    except (KeyError, IndexError, AttributeError, TypeError):
         print("Warning: do_update_falloff failed, node may not exist anymore")
 
 
@@ -654,14 +881,41 @@ def depsgraph_update_includes_all(depsgraph, types):
     return True
 
 
+DEPSGRAPH_HANDLER_BUDGET = 0.1  # Seconds, slower updates are logged (same as time_execution)
+
+
+def auto_refresh_light_list():
+    """Cached prefs.auto_refresh_light_list, the depsgraph handler runs too often to look it up every time"""
+    if const.auto_refresh_light_list is None:
+        prefs = bpy.context.preferences.addons[__package__].preferences
+        const.auto_refresh_light_list = prefs.auto_refresh_light_list
+    return const.auto_refresh_light_list
+
+
+def _update_auto_refresh_light_list(self, context):
+    const.auto_refresh_light_list = self.auto_refresh_light_list
+
+
 @persistent
 def depsgraph_update_post_handler(scene, depsgraph):
+    start = time.perf_counter()
+    handle_depsgraph_update(scene, depsgraph)
+    elapsed = time.perf_counter() - start
+
+    if bpy.app.debug_value == 666:
+        print("  Gaffer handler took {:.2f} ms".format(elapsed * 1000))
+    elif elapsed > DEPSGRAPH_HANDLER_BUDGET:
+        log("Gaffer depsgraph handler took {:.1f} ms for {} updates".format(elapsed * 1000, len(depsgraph.updates)))
+
+
+def handle_depsgraph_update(scene, depsgraph):
+    updates = depsgraph.updates
 
     # Debug mode to see what depsgraph updates are happening
     if bpy.app.debug_value == 666:
         types_updated = [id_type for id_type in const.depsgraph_id_types if depsgraph.id_type_updated(id_type)]
         print("Updated types:", types_updated)
-        for update in depsgraph.updates:
+        for update in updates:
             print(
                 "  Update:",
                 update.id,
@@ -670,38 +924,46 @@ def depsgraph_update_post_handler(scene, depsgraph):
                 update.is_updated_shading,
             )
 
-    prefs = bpy.context.preferences.addons[__package__].preferences
-    if prefs.auto_refresh_light_list:
+    auto_refresh = auto_refresh_light_list()
+
+    # A UI draw function has requested a refresh, usually when a light is deleted
+    global TAG_REFRESH_LIGHT_LIST
+    if auto_refresh and TAG_REFRESH_LIGHT_LIST:
+        TAG_REFRESH_LIGHT_LIST = False
+        log("Gaffer light list auto-refresh triggered by TAG_REFRESH_LIGHT_LIST", also_print=True)
+        refresh_light_list(scene)
+
+    # Moving objects around (the most common update by far) doesn't change lights or the world
+    if all(
+        update.is_updated_transform and not update.is_updated_geometry and not update.is_updated_shading
+        for update in updates
+    ):
+        return
+
+    # Anything but moving objects around may change what the Lights panel shows
+    invalidate_light_draw_model()
+
+    if auto_refresh:
         # A light has been added
         if depsgraph_update_includes_all(depsgraph, ["COLLECTION", "LIGHT", "OBJECT", "SCENE"]):
-            log("Gaffer light list auto-refresh triggered by depsgraph update", also_print=True)
-            refresh_light_list(scene)
+            if light_registry(scene)["lights"]:
+                update_light_list(scene, depsgraph)
+            else:
+                log("Gaffer light list auto-refresh triggered by depsgraph update", also_print=True)
+                refresh_light_list(scene)
             return
 
-        # A UI draw function has requested a refresh, usually when a light is deleted
-        global TAG_REFRESH_LIGHT_LIST
-        if TAG_REFRESH_LIGHT_LIST:
-            TAG_REFRESH_LIGHT_LIST = False
-            log("Gaffer light list auto-refresh triggered by TAG_REFRESH_LIGHT_LIST", also_print=True)
-            refresh_light_list(scene)
-
         # Light has been renamed
-        if (
-            depsgraph.id_type_updated("OBJECT")
-            and len(depsgraph.updates) == 1
-            and not depsgraph.updates[0].is_updated_transform
-            and not depsgraph.id_type_updated("SCENE")
-        ):
-            lights_str = scene.gaf_props.Lights
-            lights = stringToNestedList(lights_str)
-            all_objects = {obj.name for obj in bpy.data.objects}
-            if any(light[0][1:-1] not in all_objects for light in lights):
+        if len(updates) == 1 and not updates[0].is_updated_transform and isinstance(updates[0].id, bpy.types.Object):
+            obj = updates[0].id.original
+            light = light_registry(scene)["by_pointer"].get(obj.as_pointer())
+            if light is not None and light[0] != obj.name:
                 log("Gaffer light list auto-refresh triggered by light rename", also_print=True)
                 refresh_light_list(scene)
                 return
 
     # Keep background mix node blend mode in sync when it should be.
-    if depsgraph_update_includes_all(depsgraph, ["WORLD", "NODETREE"]):
+    if scene.world is not None and depsgraph_update_includes_all(depsgraph, ["WORLD", "NODETREE"]):
         gaf_hdri_props = scene.world.gaf_hdri_props
         context = bpy.context
         extra_nodes = any(
@@ -715,7 +977,7 @@ def depsgraph_update_post_handler(scene, depsgraph):
                 gaf_hdri_props.hdri_use_separate_color,
             ]
         )
-        if not gaf_hdri_props.hdri_use_separate_color and extra_nodes:
+        if not gaf_hdri_props.hdri_use_separate_color and extra_nodes and scene.world.node_tree:
             n = handler_node(context, "ShaderNodeMix", fetch_only=True)
             bn = handler_node(context, "ShaderNodeMix", background=True, fetch_only=True)
             if n and bn and n.blend_type != bn.blend_type:
@@ -858,7 +1120,7 @@ def update_hdri_path(self, context):
             # to "C:/real_path/to/file.jpg"
 
     detect_hdris(self, context)
-    get_hdri_haven_list(force_update=True)
+    update_hdri_haven_list(force_update=True)
 
 
 def get_hdri_basename(f):
@@ -899,6 +1161,167 @@ def path_contains(parent, child):
     return os.path.normcase(os.path.normpath(child)).startswith(os.path.normcase(os.path.normpath(parent)))
 
 
+def read_null_terminated(f, max_length=256):
+    """Read a string ending with a null byte from a binary file, without the null"""
+    chars = bytearray()
+    while len(chars) < max_length:
+        c = f.read(1)
+        if c in {b"", b"\0"}:
+            break
+        chars += c
+    return bytes(chars)
+
+
+def read_image_resolution(filepath):
+    """Return the [width, height] of an .hdr, .exr or .tif image from its header, or None if it can't be read"""
+    ext = os.path.splitext(filepath)[1].lower()
+    try:
+        with open(filepath, "rb", buffering=4096) as f:  # Headers are small, don't read more than needed
+            if ext == ".hdr":
+                # Text header ending with an empty line, then the resolution e.g. "-Y 1024 +X 2048"
+                for _ in range(64):
+                    line = f.readline(256)
+                    if not line:
+                        return None
+                    if line.strip() == b"":
+                        parts = f.readline(256).split()
+                        if len(parts) == 4:
+                            y = int(parts[1])
+                            x = int(parts[3])
+                            return [y, x] if parts[0][1:] == b"X" else [x, y]
+                        return None
+            elif ext == ".exr":
+                if f.read(4) != b"\x76\x2f\x31\x01":
+                    return None
+                f.read(4)  # Version and flags
+                # Attributes are: name, null, type, null, int32 size, value. Headers end with an empty name.
+                # Values of other attributes are skipped, so only the first few KB of the file are read
+                for _ in range(1024):
+                    name = read_null_terminated(f)
+                    if not name:
+                        return None
+                    read_null_terminated(f)  # Type
+                    size = struct.unpack("<i", f.read(4))[0]
+                    if name == b"dataWindow":
+                        xmin, ymin, xmax, ymax = struct.unpack("<4i", f.read(16))
+                        return [xmax - xmin + 1, ymax - ymin + 1]
+                    f.seek(size, os.SEEK_CUR)
+            elif ext in {".tif", ".tiff"}:
+                head = f.read(8)
+                order = {b"II": "<", b"MM": ">"}.get(head[:2])
+                if order is None:
+                    return None
+                f.seek(struct.unpack_from(order + "I", head, 4)[0])
+                num_entries = struct.unpack(order + "H", f.read(2))[0]
+                entries = f.read(num_entries * 12)
+                tags = {}
+                for i in range(0, len(entries), 12):
+                    tag, kind = struct.unpack_from(order + "HH", entries, i)
+                    if tag in {256, 257}:
+                        tags[tag] = struct.unpack_from(order + ("H" if kind == 3 else "I"), entries, i + 8)[0]
+                if 256 in tags and 257 in tags:
+                    return [tags[256], tags[257]]
+    except (OSError, ValueError, struct.error):
+        pass
+    return None
+
+
+def scan_hdri_folder(path, allowed_file_types, is_polyhaven_asset_lib=False, manifest=None, new_manifest=None):
+    """Return [hdri name, file path, file size, file mtime, [width, height] or None] for every HDRI file in path
+    and its subfolders. The resolution is read from the file header, see read_image_resolution.
+
+    Folders with the same modification time as in the manifest ({folder: record}) from the previous scan are not
+    listed again, their files and subfolders are taken from their record (only the files are stat'ed again).
+    Records of all folders go in new_manifest.
+    """
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return []
+
+    record = manifest.get(path) if manifest else None
+    if (
+        record is None
+        or record["mtime"] != mtime
+        or record["polyhaven"] != is_polyhaven_asset_lib
+        or any(len(f) < 5 for f in record["files"])  # From before resolutions were stored
+    ):
+        try:
+            entries = list(os.scandir(path))
+        except OSError:
+            return []
+
+        if time.time() - mtime < 2:
+            mtime = None  # Might still change within the file system's time resolution, don't trust it next time
+        record = {"mtime": mtime, "polyhaven": is_polyhaven_asset_lib, "files": [], "dirs": []}
+        files = []
+        for entry in entries:
+            if entry.is_file():
+                fn, ext = os.path.splitext(entry.name)
+                if not any([fn.lower().endswith(b) for b in const.thumb_endings]):
+                    if ext.lower() in allowed_file_types and not fn.startswith("."):
+                        files.append(entry)
+            else:
+                if is_polyhaven_asset_lib and entry.name == "textures":
+                    continue  # Don't detect exr textures as HDRIs in Poly Haven asset library
+                if entry.name != "_MACOSX" and entry.is_dir():
+                    record["dirs"].append(entry.path)
+        for entry in files:
+            stat = entry.stat()
+            record["files"].append(
+                [
+                    get_hdri_basename(entry.name),
+                    entry.path,
+                    stat.st_size,
+                    stat.st_mtime,
+                    read_image_resolution(entry.path),
+                ]
+            )
+    else:
+        # Files overwritten in place don't change the folder's mtime, so still check each of them
+        files = []
+        for f in record["files"]:
+            try:
+                stat = os.stat(f[1])
+            except OSError:
+                continue
+            if stat.st_size != f[2] or stat.st_mtime != f[3]:
+                f = [f[0], f[1], stat.st_size, stat.st_mtime, read_image_resolution(f[1])]
+            files.append(f)
+        record = dict(record, files=files)
+
+    if new_manifest is not None:
+        new_manifest[path] = record
+
+    found = []
+    for sub_folder in record["dirs"]:
+        found += scan_hdri_folder(sub_folder, allowed_file_types, is_polyhaven_asset_lib, manifest, new_manifest)
+    return found + record["files"]
+
+
+def get_hdri_manifest(allowed_file_types=None):
+    """Return the folder records of the last HDRI scan, if it looked for the same file types (or any if None)"""
+    if not const.hdri_manifest and os.path.exists(const.hdri_manifest_path):
+        with open(const.hdri_manifest_path) as f:
+            try:
+                const.hdri_manifest = json.load(f)
+            except json.JSONDecodeError:
+                const.hdri_manifest = {}
+    if not const.hdri_manifest:
+        return {}
+    if allowed_file_types is not None and const.hdri_manifest["file_types"] != sorted(allowed_file_types):
+        return {}
+    return const.hdri_manifest["folders"]
+
+
+def set_hdri_manifest(allowed_file_types, folders):
+    const.hdri_manifest = {"file_types": sorted(allowed_file_types), "folders": folders}
+    try:
+        write_json_atomic(const.hdri_manifest_path, const.hdri_manifest, indent=None)
+    except OSError as e:
+        log(f"Failed to write HDRI manifest: {e}", also_print=True)
+
+
 def detect_hdris(self, context):
 
     log("FN: Detect HDRIs")
@@ -907,48 +1330,46 @@ def detect_hdris(self, context):
 
     hdris = {}
 
-    def check_folder_for_HDRIs(path, is_polyhaven_asset_lib=False):
+    hdri_paths = get_persistent_setting("hdri_paths")
+    if hdri_paths[0] != "":
         prefs = bpy.context.preferences.addons[__package__].preferences
 
         l_allowed_file_types = const.allowed_file_types
         if not prefs.include_8bit:
             l_allowed_file_types = const.hdr_file_types
 
-        if os.path.exists(path):
-            files = []
-            for f in os.listdir(path):
-                if os.path.isfile(os.path.join(path, f)):
-                    fn, ext = os.path.splitext(f)
-                    if not any([fn.lower().endswith(b) for b in const.thumb_endings]):
-                        if ext.lower() in l_allowed_file_types and not fn.startswith("."):
-                            files.append(f)
-                else:
-                    if is_polyhaven_asset_lib and f == "textures":
-                        continue  # Don't detect exr textures as HDRIs in Poly Haven asset library
-                    if f != "_MACOSX":
-                        check_folder_for_HDRIs(os.path.join(path, f), is_polyhaven_asset_lib)
-
-            hdri_file_pairs = []
-            for f in files:
-                hdri_name = get_hdri_basename(f)
-                hdri_file_pairs.append([hdri_name, os.path.join(path, f)])
-
-            for h in hdri_file_pairs:
-                if h[0] in hdris:
-                    hdris[h[0]].append(h[1])
-                else:
-                    hdris[h[0]] = [h[1]]
+        asset_lib = polyhaven_asset_lib(context)
+        roots = [hp for hp in hdri_paths if os.path.exists(hp)]
+
+        # Scan each HDRI folder in its own thread, mostly waiting on the disk (or network)
+        from concurrent.futures import ThreadPoolExecutor
+
+        # Only folders that changed since the last scan are listed again
+        manifest = get_hdri_manifest(l_allowed_file_types)
+        new_manifest = {}
+        with ThreadPoolExecutor(max_workers=max(1, min(8, len(roots)))) as executor:
+            results = list(
+                executor.map(
+                    lambda hp: scan_hdri_folder(
+                        hp, l_allowed_file_types, paths_are_equal(asset_lib, hp), manifest, new_manifest
+                    ),
+                    roots,
+                )
+            )
+        set_hdri_manifest(l_allowed_file_types, new_manifest)
 
-    hdri_paths = get_persistent_setting("hdri_paths")
-    if hdri_paths[0] != "":
-        for hp in hdri_paths:
-            if not os.path.exists(hp):
-                continue
-            check_folder_for_HDRIs(hp, paths_are_equal(polyhaven_asset_lib(context), hp))
+        sizes = {}
+        for found in results:
+            for hdri_name, path, size, mtime, resolution in found:
+                if hdri_name in hdris:
+                    hdris[hdri_name].append(path)
+                else:
+                    hdris[hdri_name] = [path]
+                sizes[path] = (resolution[0] if resolution else 0, size)
 
-        # Sort variations by filesize
+        # Sort variations by resolution, then filesize
         for h in hdris:
-            hdris[h] = sorted(hdris[h], key=lambda x: os.path.getsize(x))
+            hdris[h] = sorted(hdris[h], key=lambda x: sizes[x])
 
         # Sort HDRI list alphabetically
         hdris = OrderedDict(sorted(hdris.items(), key=lambda x: x[0].lower()))
@@ -956,79 +1377,198 @@ def detect_hdris(self, context):
         with open(const.hdri_list_path, "w") as f:
             f.write(json.dumps(hdris, indent=4))
 
-        const.hdri_list = hdris
+        load_hdri_catalog(hdris)
+        gc_thumbnails()
         if "hdri" in context.scene.world.gaf_hdri_props:
             if context.scene.world.gaf_hdri_props["hdri"] >= len(const.hdri_list):
                 context.scene.world.gaf_hdri_props["hdri"] = 0
         refresh_previews()
-        prefs = bpy.context.preferences.addons[__package__].preferences
-        prefs.ForcePreviewsRefresh = True
         switch_hdri(self, context)
 
 
-def get_hdri_list(use_search=False):
-    if os.path.exists(const.hdri_list_path):
-        with open(const.hdri_list_path) as f:
-            try:
-                data = json.load(f)
-            except json.JSONDecodeError:
-                data = {}
-        if data:
-            data = OrderedDict(sorted(data.items(), key=lambda x: x[0].lower()))
-
-            if use_search:
-                gaf_hdri_props = bpy.context.scene.world.gaf_hdri_props
-                if gaf_hdri_props.hdri_favorite:
-                    new_data = {name: value for name, value in data.items() if name in get_favorites()}
-                    data = new_data
-                if gaf_hdri_props.hdri_folder_filter:
-                    new_data = {
-                        name: value
-                        for name, value in data.items()
-                        if path_contains(gaf_hdri_props.hdri_folder_filter, value[0])
-                    }
-                    data = new_data
-                search_string = gaf_hdri_props.hdri_search
-                if search_string:
-                    search_string = search_string.replace(",", " ").replace(";", " ")
-                    search_terms = search_string.split(" ")
-                    tags = get_tags()
-
-                    matched_data = {}
-
-                    for name in data:
-                        matchables = [name]
-                        sub_folder = data[name][0].split(name)[0]
-                        matchables += sub_folder.split("\\" if "\\" in sub_folder else "/")
-                        if name in tags:
-                            matchables += tags[name]
-
-                        num_matched = 0
-                        for s in search_terms:
-                            for m in matchables:
-                                if s.lower().strip() in m.lower():
-                                    num_matched += 1
-                                    break
-
-                        if num_matched == len(search_terms) or not search_terms:
-                            matched_data[name] = data[name]
-
-                    return OrderedDict(sorted(matched_data.items(), key=lambda x: x[0].lower()))
-                else:
-                    return data
-            else:
-                return data
-        else:
-            return {}
-    else:
-        return {}
+# HDRI catalog
 
 
-if len(const.hdri_list) < 1:
-    const.hdri_list = get_hdri_list()
+def load_hdri_catalog(hdris=None):
+    """Replace the in-memory HDRI catalog with hdris ({name: [variations]}), or by default gaffer_hdris.json"""
+    if hdris is None:
+        hdris = {}
+        if os.path.exists(const.hdri_list_path):
+            with open(const.hdri_list_path) as f:
+                try:
+                    hdris = json.load(f)
+                except json.JSONDecodeError:
+                    hdris = {}
+
+    names = sorted(hdris, key=lambda x: x.lower())
+    catalog = {
+        "hdris": OrderedDict((name, hdris[name]) for name in names),
+        "names": names,
+        "index": {name: i for i, name in enumerate(names)},
+        "version": const.hdri_catalog.get("version", 0) + 1,
+    }
+    const.hdri_catalog = catalog
+    const.hdri_list = catalog["hdris"]
+    return catalog
 
 
-def get_variation(hdri, mode=None, var=None):
+def get_hdri_catalog():
+    """Return the HDRI catalog, a dict with:
+    "hdris": OrderedDict of {name: [variations]} sorted by name
+    "names": list of names in the same order
+    "index": name -> position in that order
+    "version": incremented every time the catalog is replaced
+    """
+    if not const.hdri_catalog:
+        load_hdri_catalog()
+    return const.hdri_catalog
+
+
+def get_hdri_search_results():
+    """Return the catalog filtered by the favorite/folder filters and search, only filtering it again when one
+    of those has changed. Has the same "hdris", "names" and "index" as the catalog itself."""
+    catalog = get_hdri_catalog()
+    gaf_hdri_props = bpy.context.scene.world.gaf_hdri_props
+    key = (
+        catalog["version"],
+        (gaf_hdri_props.hdri_favorite, const.favorites_version),
+        gaf_hdri_props.hdri_folder_filter,
+        gaf_hdri_props.hdri_search,
+        const.tags_version,
+        id(get_tags()),
+    )
+    results = const.hdri_search_results
+    if results.get("key") == key:
+        return results
+
+    data = catalog["hdris"]
+    names = catalog["names"]
+    if gaf_hdri_props.hdri_favorite:
+        favorites = get_favorites()
+        names = [name for name in names if name in favorites]
+    if gaf_hdri_props.hdri_folder_filter:
+        names = [name for name in names if path_contains(gaf_hdri_props.hdri_folder_filter, data[name][0])]
+    if gaf_hdri_props.hdri_search:
+        matched = search_hdris(gaf_hdri_props.hdri_search)
+        names = [name for name in names if name in matched]
+
+    results = {
+        "key": key,
+        "hdris": OrderedDict((name, data[name]) for name in names),
+        "names": names,
+        "index": {name: i for i, name in enumerate(names)},
+    }
+    const.hdri_search_results = results
+    return results
+
+
+def get_hdri_list(use_search=False):
+    if use_search and get_hdri_catalog()["hdris"]:
+        return get_hdri_search_results()["hdris"]
+    return get_hdri_catalog()["hdris"]
+
+
+def get_hdri_search_index():
+    """Return the search index of the whole HDRI catalog, only rebuilding it when the catalog or tags have changed.
+    Filters like favorites are applied to the search results instead, so the index never depends on them.
+
+    Every word a search can match (HDRI names, subfolders and tags) is a "token", and tokens are indexed by
+    their 3-letter substrings so a search term only needs to be compared with tokens that contain all of its own.
+    """
+    catalog = get_hdri_catalog()
+    data = catalog["hdris"]
+    version = catalog["version"]
+    tags = get_tags()
+    index = const.hdri_search_index
+    if index and index["version"] == version and index["tags"] is tags and index["tags_version"] == const.tags_version:
+        return index
+
+    token_hdris = {}  # token -> set of HDRI names
+    for name, variations in data.items():
+        matchables = [name]
+        sub_folder = variations[0].split(name)[0]
+        matchables += sub_folder.split("\\" if "\\" in sub_folder else "/")
+        matchables += tags.get(name, [])
+        for m in matchables:
+            token_hdris.setdefault(m.lower(), set()).add(name)
+    tokens = list(token_hdris)
+    trigrams = {}  # trigram -> set of token indices
+    for i, token in enumerate(tokens):
+        for j in range(len(token) - 2):
+            trigrams.setdefault(token[j : j + 3], set()).add(i)
+
+    index = {
+        "version": version,
+        "tags": tags,
+        "tags_version": const.tags_version,
+        "tokens": tokens,
+        "token_hdris": token_hdris,
+        "trigrams": trigrams,
+        "terms": {},  # Cached term -> set of HDRI names
+        "queries": {},  # Cached tuple of terms -> set of HDRI names
+    }
+    const.hdri_search_index = index
+    return index
+
+
+def search_hdris(search_string):
+    """Return the set of names of HDRIs where every search term is part of the name, a subfolder or a tag"""
+    index = get_hdri_search_index()
+    search_string = search_string.replace(",", " ").replace(";", " ").lower()
+    terms = tuple(sorted({s.strip() for s in search_string.split(" ")} - {""}))
+    if terms in index["queries"]:
+        return index["queries"][terms]
+
+    matched = None
+    for term in terms:
+        names = index["terms"].get(term)
+        if names is None:
+            if len(term) < 3:
+                candidates = range(len(index["tokens"]))
+            else:
+                grams = sorted(
+                    (index["trigrams"].get(term[j : j + 3], set()) for j in range(len(term) - 2)),
+                    key=len,
+                )
+                candidates = grams[0].intersection(*grams[1:])
+            names = set()
+            for i in candidates:
+                token = index["tokens"][i]
+                if term in token:
+                    names |= index["token_hdris"][token]
+            index["terms"][term] = names
+        matched = names if matched is None else matched & names
+    if matched is None:  # Nothing to search for
+        matched = set(get_hdri_catalog()["hdris"])
+
+    if len(index["queries"]) > 256:
+        index["queries"].clear()
+        index["terms"].clear()
+    index["queries"][terms] = matched
+    return matched
+
+
+if not const.hdri_catalog:
+    load_hdri_catalog()
+
+
+def get_variation_info():
+    """Return {variation file path: [file size, file mtime, [width, height] or None]} from the last HDRI scan"""
+    catalog = get_hdri_catalog()
+    if const.hdri_variation_info.get("version") == catalog["version"]:
+        return const.hdri_variation_info["variations"]
+
+    variations = {}
+    for record in get_hdri_manifest().values():
+        for f in record["files"]:
+            variations[f[1]] = [f[2], f[3], f[4] if len(f) > 4 else None]
+    const.hdri_variation_info = {"version": catalog["version"], "variations": variations}
+    return variations
+
+
+def get_variation(hdri, mode=None, var=None, width=1024):
+    """Return a variation of an HDRI, either the "smallest", "biggest", the one "closest" to width pixels wide,
+    or var"""
     if hdri == "":
         return
 
@@ -1037,12 +1577,44 @@ def get_variation(hdri, mode=None, var=None):
         return variations[0]
     elif mode == "biggest":
         return variations[-1]
+    elif mode == "closest":
+        info = get_variation_info()
+        resolutions = {v: info[v][2] for v in variations if v in info and info[v][2]}
+        if resolutions:
+            return min(resolutions, key=lambda v: abs(resolutions[v][0] - width))
+        # Resolutions are unknown (not an .hdr/.exr/.tif), guess from the file name
+        for v in variations:
+            if "1k" in v:
+                return v
+        return variations[0]
     elif var:
         return var
     else:
         return "ERROR: Unsupported mode!"
 
 
+def world_node_map_key(nodes):
+    """Changes whenever nodes are added or removed, see world_node_map"""
+    return (len(nodes), nodes[-1].as_pointer() if len(nodes) else 0)
+
+
+def world_node_map(node_tree, rebuild=False, added=None):
+    """Return {node name: node} (and None: active output, once known) for a world's node tree.
+
+    Rebuilt only when the number of nodes or the last node changed, i.e. nodes were added or removed,
+    so handler_node doesn't need to loop over every node each time. Pass the node just added to keep it up to date.
+    """
+    key = world_node_map_key(node_tree.nodes)
+    entry = const.world_node_maps.get(node_tree.as_pointer())
+    if added is not None and entry is not None:
+        entry["nodes"][added.name] = added
+        entry["key"] = key
+    elif rebuild or entry is None or entry["key"] != key:
+        entry = {"key": key, "nodes": {n.name: n for n in node_tree.nodes}}
+        const.world_node_maps[node_tree.as_pointer()] = entry
+    return entry["nodes"]
+
+
 def handler_node(context, t, background=False, fetch_only=False):
     def warmth_node(context):
         group_name = "Warmth (Gaffer)"
@@ -1136,17 +1708,29 @@ def handler_node(context, t, background=False, fetch_only=False):
         return n
 
     """ Return requested node, or create it """
-    nodes = context.scene.world.node_tree.nodes
+    node_tree = context.scene.world.node_tree
+    nodes = node_tree.nodes
+    node_map = world_node_map(node_tree)
 
     if t == "ShaderNodeOutputWorld":
+        n = node_map.get(None)  # Active output
+        if n is not None and n.is_active_output:
+            return n
         for n in nodes:
             if hasattr(n, "is_active_output"):
                 if n.is_active_output:
+                    node_map[None] = n
                     return n
 
     name = "HDRIHandler_" + t + ("_B" if background else "")
-    for n in nodes:
-        if n.name == name:
+    n = node_map.get(name)
+    if n is not None and n.name == name:
+        return n
+    if n is not None or fetch_only:
+        # Renamed nodes don't invalidate the map, look again to be sure
+        node_map = world_node_map(node_tree, rebuild=True)
+        n = node_map.get(name)
+        if n is not None:
             return n
 
     if fetch_only:
@@ -1161,6 +1745,7 @@ def handler_node(context, t, background=False, fetch_only=False):
         n = nodes.new(actual_t)
     n.name = name
     n.select = False
+    world_node_map(node_tree, added=n)
 
     y_offset = 250 if background else 0
     positions = {
@@ -1197,13 +1782,62 @@ def handler_node(context, t, background=False, fetch_only=False):
 
 def set_image(context, path, node):
     if os.path.exists(path):
-        img = bpy.data.images.load(path, check_existing=True)
-        node.image = img
+        if node.image is None or node.image.filepath != path:
+            node.image = load_handler_image(path)
+            evict_handler_images()
         return True
     else:
         return False
 
 
+def load_handler_image(path):
+    """Load an image for the HDRI handler, remembering when it was last used so evict_handler_images can remove it"""
+    img = bpy.data.images.load(path, check_existing=True)
+    const.handler_images.pop(path, None)
+    const.handler_images[path] = img.name  # Most recently used last
+    return img
+
+
+def evict_handler_images():
+    """Remove the least recently used images loaded by the HDRI handler that nothing uses anymore,
+    keeping only as many as the Image Cache setting allows"""
+    prefs = bpy.context.preferences.addons[__package__].preferences
+    limit = max(prefs.hdri_image_cache_size, 2 if prefs.hdri_preload_neighbors else 0)
+
+    # Images swapped in and out for rendering aren't used in between, but need to stay
+    keep = set(const.proxy_images.values()) | set(const.proxy_swaps.values())
+    unused = []
+    for path, name in list(const.handler_images.items()):
+        img = bpy.data.images.get(name)
+        if img is None or img.filepath != path:
+            del const.handler_images[path]  # Removed or replaced by the user
+        elif img.users == 0 and name not in keep:
+            unused.append((path, img))
+    for path, img in unused[: max(0, len(unused) - limit)]:
+        del const.handler_images[path]
+        bpy.data.images.remove(img)
+
+
+def preload_neighbor_hdris():
+    """Timer that loads the images of the next and previous HDRIs in the list, so switching to them is instant"""
+    world = bpy.context.scene.world
+    if world is None or not world.gaf_hdri_props.hdri_handler_enabled:
+        return None
+    results = get_hdri_search_results()
+    names = results["names"]
+    i = results["index"].get(world.gaf_hdri_props.hdri)
+    if i is None or len(names) < 2:
+        return None
+
+    for name in {names[(i + 1) % len(names)], names[i - 1]}:
+        path = default_variation(name, world.gaf_hdri_props.hdri_use_proxy)  # The one switch_hdri would pick
+        if os.path.exists(path):
+            img = load_handler_image(path)
+            img.size  # Blender only reads the file when something needs its pixels or size
+    evict_handler_images()
+    return None
+
+
 def uses_default_values(node, node_type):
     # Return if the node is using all it's default values (and can therefore be muted to save render time)
     defaults_dict = {
@@ -1253,29 +1887,39 @@ def new_link(links, from_socket, to_socket, force=False):
         links.new(from_socket, to_socket)
 
 
+def default_variation(hdri, use_proxy):
+    """The variation to show when switching to an HDRI, also preloaded by preload_neighbor_hdris"""
+    if use_proxy:
+        # Smallest HDR variation (8-bit ones sort first as their resolution is unknown), renders swap to the biggest
+        variations = const.hdri_list[hdri]
+        hdr_variations = [v for v in variations if os.path.splitext(v)[1].lower() in const.hdr_file_types]
+        return (hdr_variations or variations)[0]
+    # Default to about 1k, big enough for the viewport
+    return get_variation(hdri, mode="closest", width=1024)
+
+
+def _update_hdri_use_proxy(self, context):
+    if self.hdri:
+        self.hdri_variation = default_variation(self.hdri, self.hdri_use_proxy)
+
+
 def switch_hdri(self, context):
     gaf_hdri_props = context.scene.world.gaf_hdri_props
     if gaf_hdri_props.hdri != "":
-        default_var = get_variation(gaf_hdri_props.hdri, mode="smallest")  # Default to smallest
-
-        # But prefer 1k if there is one
-        for v in const.hdri_list[gaf_hdri_props.hdri]:
-            if "1k" in v:
-                default_var = get_variation(gaf_hdri_props.hdri, var=v)
-                break
-
-        gaf_hdri_props.hdri_variation = default_var
+        gaf_hdri_props.hdri_variation = default_variation(gaf_hdri_props.hdri, gaf_hdri_props.hdri_use_proxy)
         setup_hdri(self, context)
+        prefs = context.preferences.addons[__package__].preferences
+        if prefs.hdri_preload_neighbors and not bpy.app.timers.is_registered(preload_neighbor_hdris):
+            bpy.app.timers.register(preload_neighbor_hdris, first_interval=0.2)
     show_hdrihaven()
 
 
-def setup_hdri(self, context):
-    gaf_props = context.scene.gaf_props
-    gaf_hdri_props = context.scene.world.gaf_hdri_props
-
-    if not gaf_hdri_props.hdri_handler_enabled:
-        return None  # Don't do anything if handler is disabled
+def hdri_handler_graph(gaf_hdri_props):
+    """Return the nodes and links the HDRI handler needs with the current settings, for setup_hdri.
 
+    Nodes are (type, background) as used by handler_node. Links are {(to node, input): (from node, output, force)},
+    where force replaces a link made by the user. Later links to the same input win over earlier ones.
+    """
     extra_nodes = any(
         [
             gaf_hdri_props.hdri_use_jpg_background,
@@ -1288,109 +1932,157 @@ def setup_hdri(self, context):
         ]
     )
 
-    w = context.scene.world
-    w.use_nodes = True
-
-    # Create Nodes
-    n_coord = handler_node(context, "ShaderNodeTexCoord")
-    n_mapping = handler_node(context, "ShaderNodeMapping")
-    n_img = handler_node(context, "ShaderNodeTexEnvironment")
-    n_warm = handler_node(context, "Warmth")
-    n_cont = handler_node(context, "ShaderNodeGamma")
-    n_sat = handler_node(context, "ShaderNodeHueSaturation")
-    n_col = handler_node(context, "ShaderNodeMix")
-    n_shader = handler_node(context, "ShaderNodeBackground")
-    n_out = handler_node(context, "ShaderNodeOutputWorld")
+    n_coord = ("ShaderNodeTexCoord", False)
+    n_mapping = ("ShaderNodeMapping", False)
+    n_img = ("ShaderNodeTexEnvironment", False)
+    n_warm = ("Warmth", False)
+    n_cont = ("ShaderNodeGamma", False)
+    n_sat = ("ShaderNodeHueSaturation", False)
+    n_col = ("ShaderNodeMix", False)
+    n_shader = ("ShaderNodeBackground", False)
+    n_out = ("ShaderNodeOutputWorld", False)
+    n_lp = ("ShaderNodeLightPath", False)
+    n_math = ("ShaderNodeMath", True)
+    nodes = [n_coord, n_mapping, n_img, n_warm, n_cont, n_sat, n_col, n_shader, n_out]
+
+    links = {}
+
+    def link(from_node, from_index, to_node, to_index, force=False):
+        links[(to_node, to_index)] = (from_node, from_index, force)
+
+    link(n_coord, 0, n_mapping, 0)
+    link(n_img, 0, n_warm, 0)
+    link(n_warm, 0, n_cont, 0)
+    link(n_cont, 0, n_sat, 4)
+    link(n_sat, 0, n_col, 6)
+    link(n_col, 2, n_shader, 0, force=True)
+
+    # Light path decides which rays see the background
+    n_ray_switch = n_math if gaf_hdri_props.hdri_use_bg_reflections else n_lp
 
     if gaf_hdri_props.hdri_use_separate_rotation:
-        n_mapping_b = handler_node(context, "ShaderNodeMapping", background=True)
-        n_mixrot = handler_node(context, "ShaderNodeMix__rot")
+        n_mapping_b = ("ShaderNodeMapping", True)
+        n_mixrot = ("ShaderNodeMix__rot", False)
+        nodes += [n_mapping_b, n_mixrot]
+        link(n_coord, 0, n_mapping_b, 0, force=True)
+        link(n_mapping, 0, n_mixrot, 4, force=True)
+        link(n_mapping_b, 0, n_mixrot, 5, force=True)
+        link(n_mixrot, 1, n_img, 0, force=True)
+        link(n_ray_switch, 0, n_mixrot, 0, force=True)
+        coords = (n_mixrot, 1)
+    else:
+        link(n_mapping, 0, n_img, 0, force=True)
+        coords = (n_mapping, 0)
 
     if extra_nodes:
-        n_img_b = handler_node(
-            context,
-            "ShaderNodeTexEnvironment",
-            background=gaf_hdri_props.hdri_use_jpg_background,
-        )
-        n_cont_b = handler_node(context, "ShaderNodeGamma", background=True)
-        n_sat_b = handler_node(context, "ShaderNodeHueSaturation", background=True)
-        n_col_b = handler_node(context, "ShaderNodeMix", background=True)
-        n_warm_b = handler_node(context, "Warmth", background=True)
-        n_shader_b = handler_node(context, "ShaderNodeBackground", background=True)
-        n_mix = handler_node(context, "ShaderNodeMixShader")
+        n_img_b = ("ShaderNodeTexEnvironment", gaf_hdri_props.hdri_use_jpg_background)
+        n_cont_b = ("ShaderNodeGamma", True)
+        n_sat_b = ("ShaderNodeHueSaturation", True)
+        n_col_b = ("ShaderNodeMix", True)
+        n_warm_b = ("Warmth", True)
+        n_shader_b = ("ShaderNodeBackground", True)
+        n_mix = ("ShaderNodeMixShader", False)
+        nodes += [n_img_b, n_cont_b, n_sat_b, n_col_b, n_warm_b, n_shader_b, n_mix]
+        link(*coords, n_img_b, 0, force=True)
+        link(n_img_b, 0, n_warm_b, 0, force=True)
+        link(n_warm_b, 0, n_cont_b, 0, force=True)
+        link(n_cont_b, 0, n_sat_b, 4, force=True)
+        link(n_sat_b, 0, n_col_b, 6, force=True)
+        link(n_col_b, 2, n_shader_b, 0, force=True)
+        link(n_shader, 0, n_mix, 1, force=True)
+        link(n_shader_b, 0, n_mix, 2, force=True)
+        link(n_ray_switch, 0, n_mix, 0, force=True)
+        link(n_mix, 0, n_out, 0, force=True)
+    else:
+        link(n_shader, 0, n_out, 0, force=True)
 
     if extra_nodes or gaf_hdri_props.hdri_use_separate_rotation:
-        n_lp = handler_node(context, "ShaderNodeLightPath")
+        nodes.append(n_lp)
         if gaf_hdri_props.hdri_use_bg_reflections:
-            n_math = handler_node(context, "ShaderNodeMath", background=True)
+            nodes.append(n_math)
+            link(n_lp, 0, n_math, 0, force=True)  # Camera Ray
+            link(n_lp, 3, n_math, 1, force=True)  # Glossy Ray
 
     if gaf_hdri_props.hdri_clamp:
-        n_shsv = handler_node(context, "ShaderNodeSeparateHSV")
-        n_clamp_val = handler_node(context, "ShaderNodeValue")
-        n_greater = handler_node(context, "ShaderNodeMath")
-        n_mix_clamp = handler_node(context, "ShaderNodeMixRGB")
-        n_chsv = handler_node(context, "ShaderNodeCombineHSV")
-
-    # Links
-    links = w.node_tree.links
-    new_link(links, n_coord.outputs[0], n_mapping.inputs[0])
-    new_link(links, n_img.outputs[0], n_warm.inputs[0])
-    new_link(links, n_warm.outputs[0], n_cont.inputs[0])
-    new_link(links, n_cont.outputs[0], n_sat.inputs[4])
-    new_link(links, n_sat.outputs[0], n_col.inputs[6])
-    new_link(links, n_col.outputs[2], n_shader.inputs[0], force=True)
+        n_shsv = ("ShaderNodeSeparateHSV", False)
+        n_clamp_val = ("ShaderNodeValue", False)
+        n_greater = ("ShaderNodeMath", False)
+        n_mix_clamp = ("ShaderNodeMixRGB", False)
+        n_chsv = ("ShaderNodeCombineHSV", False)
+        nodes += [n_shsv, n_clamp_val, n_greater, n_mix_clamp, n_chsv]
+        link(n_col, 2, n_shsv, 0)
+        link(n_shsv, 0, n_chsv, 0)
+        link(n_shsv, 1, n_chsv, 1)
+        link(n_shsv, 2, n_greater, 0)
+        link(n_shsv, 2, n_mix_clamp, 1)
+        link(n_clamp_val, 0, n_greater, 1)
+        link(n_clamp_val, 0, n_mix_clamp, 2)
+        link(n_greater, 0, n_mix_clamp, 0)
+        link(n_mix_clamp, 0, n_chsv, 2)
+        link(n_chsv, 0, n_shader, 0, force=True)
+
+    return nodes, links
 
-    if gaf_hdri_props.hdri_use_separate_rotation:
-        new_link(links, n_coord.outputs[0], n_mapping_b.inputs[0], force=True)
-        new_link(links, n_mapping.outputs[0], n_mixrot.inputs[4], force=True)
-        new_link(links, n_mapping_b.outputs[0], n_mixrot.inputs[5], force=True)
-        new_link(links, n_mixrot.outputs[1], n_img.inputs[0], force=True)
-        coords_socket = n_mixrot.outputs[1]
-        if gaf_hdri_props.hdri_use_bg_reflections:
-            new_link(links, n_math.outputs[0], n_mixrot.inputs[0], force=True)
-        else:
-            new_link(links, n_lp.outputs[0], n_mixrot.inputs[0], force=True)
-    else:
-        new_link(links, n_mapping.outputs[0], n_img.inputs[0], force=True)
-        coords_socket = n_mapping.outputs[0]
 
-    if extra_nodes:
-        new_link(links, coords_socket, n_img_b.inputs[0], force=True)
-        new_link(links, n_img_b.outputs[0], n_warm_b.inputs[0], force=True)
-        new_link(links, n_warm_b.outputs[0], n_cont_b.inputs[0], force=True)
-        new_link(links, n_cont_b.outputs[0], n_sat_b.inputs[4], force=True)
-        new_link(links, n_sat_b.outputs[0], n_col_b.inputs[6], force=True)
-        new_link(links, n_col_b.outputs[2], n_shader_b.inputs[0], force=True)
-        new_link(links, n_shader.outputs[0], n_mix.inputs[1], force=True)
-        new_link(links, n_shader_b.outputs[0], n_mix.inputs[2], force=True)
-        if gaf_hdri_props.hdri_use_bg_reflections:
-            new_link(links, n_math.outputs[0], n_mix.inputs[0], force=True)
-        else:
-            new_link(links, n_lp.outputs[0], n_mix.inputs[0], force=True)
-        new_link(links, n_mix.outputs[0], n_out.inputs[0], force=True)
-    else:
-        new_link(links, n_shader.outputs[0], n_out.inputs[0], force=True)
+def setup_hdri(self, context):
+    gaf_props = context.scene.gaf_props
+    gaf_hdri_props = context.scene.world.gaf_hdri_props
 
-    if extra_nodes or gaf_hdri_props.hdri_use_separate_rotation:
-        if gaf_hdri_props.hdri_use_bg_reflections:
-            new_link(links, n_lp.outputs[0], n_math.inputs[0], force=True)  # Camera Ray
-            new_link(links, n_lp.outputs[3], n_math.inputs[1], force=True)  # Glossy Ray
+    if not gaf_hdri_props.hdri_handler_enabled:
+        return None  # Don't do anything if handler is disabled
 
-    if gaf_hdri_props.hdri_clamp:
-        new_link(links, n_col.outputs[2], n_shsv.inputs[0])
-        new_link(links, n_shsv.outputs[0], n_chsv.inputs[0])
-        new_link(links, n_shsv.outputs[1], n_chsv.inputs[1])
-        new_link(links, n_shsv.outputs[2], n_greater.inputs[0])
-        new_link(links, n_shsv.outputs[2], n_mix_clamp.inputs[1])
-        new_link(links, n_clamp_val.outputs[0], n_greater.inputs[1])
-        new_link(links, n_clamp_val.outputs[0], n_mix_clamp.inputs[2])
-        new_link(links, n_greater.outputs[0], n_mix_clamp.inputs[0])
-        new_link(links, n_mix_clamp.outputs[0], n_chsv.inputs[2])
-        new_link(links, n_chsv.outputs[0], n_shader.inputs[0], force=True)
+    w = context.scene.world
+    if not w.use_nodes:
+        w.use_nodes = True
+    node_tree = w.node_tree
+
+    # Only create nodes and links when the graph needs to change, switching HDRIs just swaps the images
+    graph_nodes, graph_links = hdri_handler_graph(gaf_hdri_props)
+    graph = (tuple(graph_nodes), tuple(graph_links.items()), gaf_hdri_props.hdri_use_darkened_jpg)
+    graph_changed = const.hdri_graph_state.get(node_tree.as_pointer()) != (
+        graph,
+        world_node_map_key(node_tree.nodes),
+        len(node_tree.links),
+        handler_node(context, "ShaderNodeOutputWorld").as_pointer(),
+    )
+    if graph_changed:
+        nodes = {node: handler_node(context, node[0], background=node[1]) for node in graph_nodes}
+        for (to_node, to_index), (from_node, from_index, force) in graph_links.items():
+            to_socket = nodes[to_node].inputs[to_index]
+            from_socket = nodes[from_node].outputs[from_index]
+            if to_socket.is_linked and (not force or to_socket.links[0].from_socket == from_socket):
+                continue
+            node_tree.links.new(from_socket, to_socket)
+        const.hdri_graph_state[node_tree.as_pointer()] = (
+            graph,
+            world_node_map_key(node_tree.nodes),
+            len(node_tree.links),
+            nodes[("ShaderNodeOutputWorld", False)].as_pointer(),
+        )
+
+    extra_nodes = any(
+        [
+            gaf_hdri_props.hdri_use_jpg_background,
+            gaf_hdri_props.hdri_use_separate_brightness,
+            gaf_hdri_props.hdri_use_separate_contrast,
+            gaf_hdri_props.hdri_use_separate_saturation,
+            gaf_hdri_props.hdri_use_separate_warmth,
+            gaf_hdri_props.hdri_use_separate_tint,
+            gaf_hdri_props.hdri_use_separate_color,
+        ]
+    )
+    n_img = handler_node(context, "ShaderNodeTexEnvironment")
+    if extra_nodes:
+        n_img_b = handler_node(
+            context,
+            "ShaderNodeTexEnvironment",
+            background=gaf_hdri_props.hdri_use_jpg_background,
+        )
 
     # Set Env images
     gaf_props.FileNotFoundError = not os.path.exists(gaf_hdri_props.hdri_variation)
     set_image(context, gaf_hdri_props.hdri_variation, n_img)
+    prepare_proxy_render(context.scene.world)
     if extra_nodes:
         if gaf_hdri_props.hdri_use_jpg_background:
             jpg_path = os.path.join(const.jpg_dir, gaf_hdri_props.hdri + ".jpg")
@@ -1403,6 +2095,9 @@ def setup_hdri(self, context):
             else:
                 gaf_props.RequestJPGGen = True
 
+    if not graph_changed:
+        return None  # Node values are already up to date
+
     # Run Updates
     update_rotation(self, context)
     update_brightness(self, context)
@@ -1463,7 +2158,7 @@ def hdri_enable(self, context):
             setup_hdri(self, context)
             prefs.ForcePreviewsRefresh = True
             if gaf_hdri_props.hdri:
-                if not os.path.exists(os.path.join(const.thumbnail_dir, gaf_hdri_props.hdri + "__thumb_preview.jpg")):
+                if get_thumbnail(gaf_hdri_props.hdri) is None:
                     prefs.RequestThumbGen = True
         else:
             gaf_hdri_props.hdri_handler_enabled = False
@@ -1493,10 +2188,99 @@ def update_variation(self, context):
     n = handler_node(context, "ShaderNodeTexEnvironment")
     gaf_props.FileNotFoundError = not os.path.exists(gaf_hdri_props.hdri_variation)
     set_image(context, gaf_hdri_props.hdri_variation, n)
+    prepare_proxy_render(context.scene.world)
 
     return None
 
 
+def queue_update(update):
+    """Wrap an update_* function for use as a property's update callback: changes only mark it as pending, and
+    apply_queued_updates runs it once on the next event loop tick. Dragging a slider then updates the world nodes
+    (and restarts the viewport render) once per redraw instead of for every change"""
+
+    def queued_update(self, context):
+        const.queued_updates[update] = self
+        if not bpy.app.timers.is_registered(apply_queued_updates):
+            bpy.app.timers.register(apply_queued_updates, first_interval=0)
+
+    queued_update.__name__ = update.__name__
+    return queued_update
+
+
+def apply_queued_updates():
+    updates = list(const.queued_updates.items())
+    const.queued_updates.clear()
+    for update, self in updates:
+        try:
+            update(self, bpy.context)
+        except ReferenceError:
+            pass  # World was removed in the meantime
+    return None
+
+
+@persistent
+def flush_queued_updates(scene, *args):
+    """Apply pending updates before rendering, so a script that changes a property and then renders right away (before
+    the timer gets to run) doesn't render stale values"""
+    if const.queued_updates:
+        if bpy.app.timers.is_registered(apply_queued_updates):
+            bpy.app.timers.unregister(apply_queued_updates)
+        apply_queued_updates()
+
+
+def prepare_proxy_render(world):
+    """Load (without reading its pixels) the biggest variation for proxy_render_pre to swap in. The render handlers
+    may run in the render thread, where images can't be loaded or removed safely"""
+    gaf_hdri_props = world.gaf_hdri_props
+    const.proxy_images.pop(world.name, None)
+    if not gaf_hdri_props.hdri_handler_enabled or not gaf_hdri_props.hdri_use_proxy:
+        return
+    if gaf_hdri_props.hdri in get_hdri_catalog()["hdris"]:
+        full_res = get_variation(gaf_hdri_props.hdri, mode="biggest")
+        if os.path.exists(full_res):
+            const.proxy_images[world.name] = load_handler_image(full_res).name
+
+
+def prepare_proxy_renders():
+    """prepare_proxy_render for every world, since the images it loads aren't saved in the blend file"""
+    for world in bpy.data.worlds:
+        prepare_proxy_render(world)
+    return None
+
+
+@persistent
+def proxy_render_pre(scene, *args):
+    """Render with the biggest variation of the HDRI when the viewport uses a small proxy"""
+    import threading
+
+    w = scene.world
+    if w is None or w.name in const.proxy_swaps:
+        return  # Already swapped, render_pre runs for every frame of an animation
+    if not w.gaf_hdri_props.hdri_handler_enabled or not w.gaf_hdri_props.hdri_use_proxy:
+        return
+    if w.name not in const.proxy_images and threading.current_thread() is threading.main_thread():
+        prepare_proxy_render(w)  # Safe to load here, e.g. a render started by a script before anything prepared it
+    n = w.node_tree.nodes.get("HDRIHandler_ShaderNodeTexEnvironment") if w.node_tree else None
+    full_res = bpy.data.images.get(const.proxy_images.get(w.name, ""))
+    if n is None or n.image is None or full_res is None:
+        return
+
+    const.proxy_swaps[w.name] = n.image.name
+    n.image = full_res
+
+
+@persistent
+def proxy_render_post(scene, *args):
+    """Go back to the viewport proxy once rendering is complete or cancelled, see proxy_render_pre"""
+    w = scene.world
+    if w is None or w.name not in const.proxy_swaps:
+        return
+    proxy = bpy.data.images.get(const.proxy_swaps.pop(w.name))
+    n = w.node_tree.nodes.get("HDRIHandler_ShaderNodeTexEnvironment") if w.node_tree else None
+    if n is not None and proxy is not None:
+        n.image = proxy
+
+
 def update_rotation(self, context):
     gaf_hdri_props = context.scene.world.gaf_hdri_props
     if not gaf_hdri_props.hdri_handler_enabled:
@@ -1824,6 +2608,126 @@ def update_background_color(self, context):
     return None
 
 
+# Thumbnail cache
+
+THUMBNAIL_CACHE_LIMIT = 20000  # Least recently used thumbnails are deleted beyond this many
+
+
+def get_hdri_fingerprints():
+    """Return {HDRI name: fingerprint of the path, size and modification time of its files at the last scan}.
+    HDRIs whose files are not in the scan manifest (e.g. no scan since updating Gaffer) have no fingerprint"""
+    catalog = get_hdri_catalog()
+    if const.hdri_fingerprints.get("version") == catalog["version"]:
+        return const.hdri_fingerprints["fingerprints"]
+
+    files = get_variation_info()
+    fingerprints = {}
+    for name, variations in catalog["hdris"].items():
+        if all(v in files for v in variations):
+            key = "|".join(v + ":" + str(files[v][:2]) for v in variations)
+            fingerprints[name] = hashlib.sha1(key.encode()).hexdigest()[:16]
+    const.hdri_fingerprints = {"version": catalog["version"], "fingerprints": fingerprints}
+    return fingerprints
+
+
+def get_thumbnail_index():
+    """Return {HDRI name: {"fingerprint", "file", "used"}} for every thumbnail in const.thumbnail_dir"""
+    index = read_json_cached(const.thumbnail_index_path)
+    if "thumbnails" not in index:
+        # Adopt thumbnails made before they were indexed, named only after the HDRI. Their fingerprint is
+        # unknown (None) until get_thumbnail sees one, the files may not have been scanned yet
+        index["thumbnails"] = {}
+        hdris = get_hdri_catalog()["hdris"]
+        for f in os.listdir(const.thumbnail_dir):
+            name = f[: -len("__thumb_preview.jpg")]
+            if f.endswith("__thumb_preview.jpg") and name in hdris:
+                index["thumbnails"][name] = {"fingerprint": None, "file": f, "used": time.time()}
+        write_json_later(const.thumbnail_index_path)
+    return index["thumbnails"]
+
+
+def get_thumbnail(name):
+    """Return the thumbnail file of an HDRI, or None if it has none or the HDRI changed since it was made"""
+    entry = get_thumbnail_index().get(name)
+    if entry is None:
+        return None
+    fingerprint = get_hdri_fingerprints().get(name)
+    if entry["fingerprint"] is None and fingerprint is not None:
+        entry["fingerprint"] = fingerprint  # Adopted thumbnail, trust it for the files as they are now
+        write_json_later(const.thumbnail_index_path)
+    elif entry["fingerprint"] != fingerprint and fingerprint is not None:
+        return None
+    return os.path.join(const.thumbnail_dir, entry["file"])
+
+
+def new_thumbnail_path(name):
+    fingerprint = get_hdri_fingerprints().get(name) or "unknown"
+    return os.path.join(const.thumbnail_dir, name + "__" + fingerprint + "__thumb_preview.jpg")
+
+
+def set_thumbnail(name, thumb_file):
+    """Add a newly made thumbnail to the index, deleting the HDRI's previous one"""
+    index = get_thumbnail_index()
+    old_entry = index.get(name)
+    if old_entry and old_entry["file"] != os.path.basename(thumb_file):
+        try:
+            os.remove(os.path.join(const.thumbnail_dir, old_entry["file"]))
+        except OSError:
+            pass
+    index[name] = {
+        "fingerprint": get_hdri_fingerprints().get(name),
+        "file": os.path.basename(thumb_file),
+        "used": time.time(),
+    }
+    write_json_later(const.thumbnail_index_path)
+
+
+def touch_thumbnail(name):
+    entry = get_thumbnail_index().get(name)
+    if entry is not None:
+        entry["used"] = time.time()
+        write_json_later(const.thumbnail_index_path)
+
+
+def reset_thumbnail_index():
+    write_json_later(const.thumbnail_index_path, {"thumbnails": {}})
+
+
+def gc_thumbnails():
+    """Delete thumbnails of HDRIs that changed or no longer exist, and the least recently used ones
+    beyond THUMBNAIL_CACHE_LIMIT"""
+    hdris = get_hdri_catalog()["hdris"]
+    if not hdris:
+        return  # Probably the HDRI folder is just unavailable, don't throw everything away
+    fingerprints = get_hdri_fingerprints()
+    # HDRIs in a folder that is offline (e.g. a network drive) may come back, only forget them if all were scanned
+    all_scanned = all(os.path.exists(hp) for hp in get_persistent_setting("hdri_paths"))
+
+    index = get_thumbnail_index()
+    for name, entry in list(index.items()):
+        if name not in hdris:
+            if all_scanned:
+                del index[name]
+        elif entry["fingerprint"] is not None and fingerprints.get(name) not in {None, entry["fingerprint"]}:
+            del index[name]
+    if len(index) > THUMBNAIL_CACHE_LIMIT:
+        for name in sorted(index, key=lambda n: index[n]["used"])[: len(index) - THUMBNAIL_CACHE_LIMIT]:
+            del index[name]
+    write_json_later(const.thumbnail_index_path)
+
+    keep = {entry["file"] for entry in index.values()}
+    num_deleted = 0
+    for f in os.listdir(const.thumbnail_dir):
+        if f not in keep:
+            try:
+                os.remove(os.path.join(const.thumbnail_dir, f))
+                num_deleted += 1
+            except OSError:
+                pass
+    if num_deleted:
+        log("Deleted " + str(num_deleted) + " outdated thumbnails")
+
+
 def missing_thumb():
     return os.path.join(const.icon_dir, "special", "missing_thumb.png")
 
@@ -1865,6 +2769,187 @@ def save_image(context, img, filepath, fileformat, exposure=0):
         setattr(vs, a, old_vs[a])
 
 
+JPG_CHUNK_ROWS = 256  # Rows converted at once by save_array_as_jpg, ~50 MB of temporaries for a 16k image
+
+
+def image_to_array(img):
+    """Return the pixels of a Blender image as a float32 numpy array with the shape (height, width, 3)"""
+    import numpy as np
+
+    width, height = img.size
+    pixels = np.empty(width * height * img.channels, dtype=np.float32)
+    img.pixels.foreach_get(pixels)
+    pixels = pixels.reshape(height, width, img.channels)
+    if img.channels < 3:
+        return np.repeat(pixels[..., :1], 3, axis=2)
+    return pixels[..., :3]
+
+
+def resize_array(pixels, width, height):
+    """Scale an image array down by averaging blocks of pixels, then pick the nearest pixels for the exact size"""
+    import numpy as np
+
+    factor = max(1, min(pixels.shape[1] // width, pixels.shape[0] // height))
+    if factor > 1:
+        block_h = pixels.shape[0] // factor
+        block_w = pixels.shape[1] // factor
+        pixels = pixels[: block_h * factor, : block_w * factor]
+        pixels = pixels.reshape(block_h, factor, block_w, factor, -1).mean(axis=(1, 3))
+    ys = np.arange(height) * pixels.shape[0] // height
+    xs = np.arange(width) * pixels.shape[1] // width
+    return pixels[ys][:, xs]
+
+
+def linear_to_srgb(pixels, exposure=0):
+    """Apply an exposure (in stops) to linear colors and convert them to sRGB, clipped to 0-1"""
+    import numpy as np
+
+    rgb = np.clip(pixels * 2**exposure, 0, 1)
+    return np.where(rgb <= 0.0031308, rgb * 12.92, 1.055 * np.power(rgb, 1 / 2.4) - 0.055)
+
+
+def srgb_to_linear(pixels):
+    """Inverse of linear_to_srgb, for 8-bit images"""
+    import numpy as np
+
+    return np.where(pixels <= 0.04045, pixels / 12.92, np.power((pixels + 0.055) / 1.055, 2.4))
+
+
+def save_array_as_jpg(pixels, filepath, convert=None):
+    """Save an sRGB image array with the shape (height, width, 3) as a JPG. convert is applied to a few rows at
+    a time while copying them, so converting a big image doesn't need full size temporary arrays"""
+    import numpy as np
+
+    height, width = pixels.shape[:2]
+    rgba = np.ones((height, width, 4), dtype=np.float32)
+    for y in range(0, height, JPG_CHUNK_ROWS):
+        rows = pixels[y : y + JPG_CHUNK_ROWS]
+        rgba[y : y + JPG_CHUNK_ROWS, :, :3] = convert(rows) if convert else rows
+    img = bpy.data.images.new("Gaffer Temp JPG", width, height)
+    try:
+        img.pixels.foreach_set(rgba.ravel())
+        img.filepath_raw = filepath
+        img.file_format = "JPEG"
+        img.save(quality=95)
+    finally:
+        bpy.data.images.remove(img)
+
+
+def generate_thumbnail(filepath, thumb_file, width=200):
+    """Make a small JPG of an HDRI in this Blender process, instead of rendering it with resize.py"""
+    img = bpy.data.images.load(filepath, check_existing=False)
+    try:
+        pixels = image_to_array(img)
+        is_float = img.is_float
+    finally:
+        bpy.data.images.remove(img)
+
+    height = max(1, math.floor(width / (pixels.shape[1] / pixels.shape[0])))
+    pixels = resize_array(pixels, width, height)
+    if is_float:
+        pixels = linear_to_srgb(pixels)  # 8-bit images already are
+    save_array_as_jpg(pixels, thumb_file)
+
+
+def generate_background_jpgs(filepath, jpg_path, dark_jpg_path, max_width=0):
+    """Make the normal and darkened (-4 EV) background JPGs of an HDRI from a single read of its pixels,
+    optionally scaled down to max_width first. Only paths that are not None are written"""
+    img = bpy.data.images.load(filepath, check_existing=False)
+    try:
+        pixels = image_to_array(img)
+        is_float = img.is_float
+    finally:
+        bpy.data.images.remove(img)
+
+    if max_width and pixels.shape[1] > max_width:
+        height = max(1, math.floor(max_width / (pixels.shape[1] / pixels.shape[0])))
+        pixels = resize_array(pixels, max_width, height)
+
+    if jpg_path:
+        save_array_as_jpg(pixels, jpg_path, linear_to_srgb if is_float else None)  # 8-bit images already are sRGB
+    if dark_jpg_path:
+        if is_float:
+            save_array_as_jpg(pixels, dark_jpg_path, lambda rows: linear_to_srgb(rows, -4))
+        else:
+            save_array_as_jpg(pixels, dark_jpg_path, lambda rows: linear_to_srgb(srgb_to_linear(rows), -4))
+
+
+def start_resize_workers(jobs, processes, max_workers=4):
+    """Run resize.py jobs in background Blender processes, one per CPU core but at most max_workers since each
+    holds a whole image in memory. Started processes are added to processes so they can be stopped.
+    Returns the executor and a future for each batch of jobs"""
+    import json
+    import tempfile
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from subprocess import Popen
+
+    cmd = [
+        bpy.app.binary_path,
+        "--background",
+        "--factory-startup",
+        "--python",
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "resize.py"),
+        "--",
+        "--manifest",
+    ]
+
+    def run_worker(worker_jobs):
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+            json.dump(worker_jobs, f)
+        try:
+            with executor.lock:
+                if executor.cancelled:
+                    return  # Stopped before this batch started
+                process = Popen(cmd + [f.name])
+                processes.append(process)
+            process.wait()
+        finally:
+            os.remove(f.name)
+
+    # Several small batches per process rather than one big one, so progress can be shown.
+    # Jobs for the same image stay in the same batch, so it's only loaded once
+    num_workers = max(1, min(len(jobs), os.cpu_count() or 1, max_workers))
+    batch_size = math.ceil(len(jobs) / (num_workers * 4))
+    batches = [[]]
+    for job in jobs:
+        if len(batches[-1]) >= batch_size and batches[-1][-1][0] != job[0]:
+            batches.append([])
+        batches[-1].append(job)
+    executor = ThreadPoolExecutor(max_workers=num_workers)
+    executor.lock = threading.Lock()  # So stop_resize_workers can't miss a process that is just starting
+    executor.cancelled = False
+    futures = [executor.submit(run_worker, batch) for batch in batches]
+    return executor, futures
+
+
+RESIZE_MEMORY_BUDGET = 8 * 1024**3  # Bytes, for all resize.py processes together
+
+
+def resize_worker_limit(filepaths, max_workers=4):
+    """Return how many resize.py processes can run at once with the biggest of these images loaded in each"""
+    info = get_variation_info()
+    biggest = 1
+    for fp in filepaths:
+        resolution = info[fp][2] if fp in info else None
+        if resolution:
+            biggest = max(biggest, resolution[0] * resolution[1] * 16)  # Float RGBA
+        elif os.path.exists(fp):
+            biggest = max(biggest, os.path.getsize(fp) * 4)  # Unknown resolution, guess from the compressed size
+    return max(1, min(max_workers, RESIZE_MEMORY_BUDGET // biggest))
+
+
+def stop_resize_workers(executor, processes):
+    if executor is None:
+        return
+    executor.shutdown(wait=False, cancel_futures=True)
+    with executor.lock:
+        executor.cancelled = True
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+
+
 def nice_hdri_name(name):
     dont_capitalize = [
         "a",
@@ -1893,18 +2978,20 @@ def previews_register():
 
     pcoll = bpy.utils.previews.new()
     pcoll.previews = ()
+    pcoll.thumb_files = {}  # HDRI name: thumbnail the preview was loaded from, see refresh_previews
+    pcoll.new("__loading__")  # Blank icon for previews that aren't loaded yet
     const.preview_collections["main"] = pcoll
 
-    import bpy.utils.previews
-
-    const.custom_icons = bpy.utils.previews.new()
-    for f in os.listdir(const.icon_dir):
-        if f.endswith(".png"):
-            const.custom_icons.load(
-                os.path.splitext(os.path.basename(f))[0],
-                os.path.join(const.icon_dir, f),
-                "IMAGE",
-            )
+    # UI icons never change, load them once per session
+    if const.custom_icons is None:
+        const.custom_icons = bpy.utils.previews.new()
+        for f in os.listdir(const.icon_dir):
+            if f.endswith(".png"):
+                const.custom_icons.load(
+                    os.path.splitext(os.path.basename(f))[0],
+                    os.path.join(const.icon_dir, f),
+                    "IMAGE",
+                )
 
 
 def previews_unregister():
@@ -1912,7 +2999,9 @@ def previews_unregister():
         bpy.utils.previews.remove(pcoll)
     const.preview_collections.clear()
 
-    bpy.utils.previews.remove(const.custom_icons)
+    if const.custom_icons is not None:
+        bpy.utils.previews.remove(const.custom_icons)
+        const.custom_icons = None
 
 
 def get_icons():
@@ -1920,11 +3009,26 @@ def get_icons():
 
 
 def refresh_previews():
-    previews_unregister()
-    previews_register()
+    """Bring the loaded previews up to date with the HDRI list and thumbnails,
+    without throwing away the ones that haven't changed"""
+    pcoll = const.preview_collections.get("main")
+    if pcoll is None:
+        previews_register()
+    else:
+        hdris = get_hdri_catalog()["hdris"]
+        for name, thumb_file in list(pcoll.thumb_files.items()):
+            if name not in hdris:
+                del pcoll[name]
+                del pcoll.thumb_files[name]
+            elif get_thumbnail(name) != thumb_file:
+                del pcoll[name]
+                load_preview(pcoll, name, get_thumbnail(name))
     bpy.context.preferences.addons[__package__].preferences.ForcePreviewsRefresh = True
 
 
+PREVIEWS_PER_TICK = 100  # Loaded at once by hdri_enum_previews and load_previews_progressively
+
+
 def hdri_enum_previews(self, context):
     enum_items = []
 
@@ -1940,33 +3044,69 @@ def hdri_enum_previews(self, context):
     else:
         prefs.ForcePreviewsRefresh = False
 
-    # Make indexes for all HDRIs
-    indexes = {}
-    all_hdris = get_hdri_list()
-    for i, name in enumerate(all_hdris):
-        indexes[name] = i
+    indexes = get_hdri_catalog()["index"]
+    world = context.scene.world
+    current_hdri = world.gaf_hdri_props.get("hdri") if world else None  # Stored index, reading the enum would recurse
 
+    # Only the first previews (and the current one) are loaded right away, the rest by load_previews_progressively
     all_thumbs_exist = True
-    for i, name in enumerate(get_hdri_list(use_search=True)):
-
-        thumb_file = os.path.join(const.thumbnail_dir, name + "__thumb_preview.jpg")
-        if not os.path.exists(thumb_file):
-            print("Missing thumb", name)
-            all_thumbs_exist = False
-            thumb_file = missing_thumb()
-
-        if name in pcoll:
-            thumb = pcoll[name]
-        else:
-            thumb = pcoll.load(name, thumb_file, "IMAGE")
+    any_loading = False
+    num_loaded = 0
+    for name in get_hdri_list(use_search=True):
+        if name not in pcoll:
+            thumb_file = get_thumbnail(name)
+            if thumb_file is None:
+                all_thumbs_exist = False
+            if num_loaded < PREVIEWS_PER_TICK or indexes[name] == current_hdri:
+                load_preview(pcoll, name, thumb_file)
+                num_loaded += 1
+        elif pcoll.thumb_files.get(name) is None:
+            all_thumbs_exist = False  # Loaded with the missing thumbnail icon
+        thumb = pcoll.get(name)
+        if thumb is None:
+            thumb = pcoll["__loading__"]
+            any_loading = True
         enum_items.append((name, name, "", thumb.icon_id, indexes[name]))
 
     prefs.RequestThumbGen = not all_thumbs_exist
+    if any_loading and not bpy.app.timers.is_registered(load_previews_progressively):
+        bpy.app.timers.register(load_previews_progressively, first_interval=0.1)
 
     pcoll.previews = enum_items
     return pcoll.previews
 
 
+def load_preview(pcoll, name, thumb_file):
+    pcoll.thumb_files[name] = thumb_file
+    if thumb_file is None:
+        print("Missing thumb", name)
+        thumb_file = missing_thumb()
+    pcoll.load(name, thumb_file, "IMAGE")
+    touch_thumbnail(name)
+
+
+def load_previews_progressively():
+    """Timer that loads the previews hdri_enum_previews skipped, a few at a time so the UI doesn't stall"""
+    pcoll = const.preview_collections.get("main")
+    if pcoll is None:
+        return None
+
+    num_loaded = 0
+    for name in get_hdri_list(use_search=True):
+        if name not in pcoll:
+            load_preview(pcoll, name, get_thumbnail(name))
+            num_loaded += 1
+            if num_loaded == PREVIEWS_PER_TICK:
+                break
+
+    # Rebuild the enum with the new icons
+    bpy.context.preferences.addons[__package__].preferences.ForcePreviewsRefresh = True
+    for window in bpy.context.window_manager.windows:
+        for area in window.screen.areas:
+            area.tag_redraw()
+    return 0.05 if num_loaded == PREVIEWS_PER_TICK else None
+
+
 def variation_enum_previews(self, context):
     enum_items = []
     gaf_hdri_props = context.scene.world.gaf_hdri_props
@@ -1981,63 +3121,66 @@ def variation_enum_previews(self, context):
     return enum_items
 
 
-def get_favorites_dict(force_update=False):
-    if force_update or not const.favorites:
-        if os.path.exists(const.favorites_path):
-            with open(const.favorites_path) as f:
-                try:
-                    data = json.load(f)
-                except json.JSONDecodeError:
-                    data = {}
-            const.favorites = data
-            return data
-        else:
-            return {}
-    else:
-        return const.favorites
+def get_favorites_dict():
+    return read_json_cached(const.favorites_path)
 
 
-def get_favorites(force_update=False):
-    d = get_favorites_dict(force_update)
-    return {k: v for k, v in d.items() if v}
+def get_favorites():
+    """Return the set of favorite HDRI names, only rebuilt when favorites.json is reloaded"""
+    favorites = get_favorites_dict()
+    if const.favorites.get("data") is not favorites:
+        const.favorites = {"data": favorites, "names": {k for k, v in favorites.items() if v}}
+        const.favorites_version += 1
+    return const.favorites["names"]
 
 
 def set_favorite(name, favorite=True):
-    favorites_list = get_favorites_dict()
-    favorites_list[name] = favorite
-    const.favorites[name] = favorite
-
-    with open(const.favorites_path, "w") as f:
-        f.write(json.dumps(favorites_list, indent=4))
+    names = get_favorites()
+    get_favorites_dict()[name] = favorite
+    if favorite:
+        names.add(name)
+    else:
+        names.discard(name)
+    const.favorites_version += 1
+    write_json_later(const.favorites_path)
 
 
 def get_tags():
-    if os.path.exists(const.tags_path):
-        with open(const.tags_path) as f:
-            try:
-                data = json.load(f)
-            except json.JSONDecodeError:
-                data = {}
-        return data
-    else:
-        return {}
+    """Return {HDRI name: [tags]}. This is shared with the tag index, so change it with set_tag"""
+    return read_json_cached(const.tags_path)
+
+
+def get_tag_index():
+    """Return {tag: set of HDRI names}, the reverse of get_tags, only rebuilt when tags.json is reloaded"""
+    tags = get_tags()
+    if const.tag_index.get("data") is not tags:
+        by_tag = {}
+        for name, hdri_tags in tags.items():
+            for t in hdri_tags:
+                by_tag.setdefault(t, set()).add(name)
+        const.tag_index = {"data": tags, "by_tag": by_tag}
+    return const.tag_index["by_tag"]
 
 
 def set_tag(name, tag, toggle=True):
     tag = tag.strip().lower()
+    tag_index = get_tag_index()
     tag_list = get_tags()
     if name in tag_list:
         current_tags = tag_list[name]
         if tag not in current_tags:
             tag_list[name].append(tag)
+            tag_index.setdefault(tag, set()).add(name)
         elif toggle:
             i = tag_list[name].index(tag)
             del tag_list[name][i]
+            tag_index[tag].discard(name)
     else:
         tag_list[name] = [tag]
+        tag_index.setdefault(tag, set()).add(name)
+    const.tags_version += 1
 
-    with open(const.tags_path, "w") as f:
-        f.write(json.dumps(tag_list, indent=4))
+    write_json_later(const.tags_path)
 
 
 def set_custom_tags(self, context):
@@ -2055,13 +3198,8 @@ def set_custom_tags(self, context):
 
 
 def get_possible_tags_list():
-    tags_list = get_tags()
     possible_tags = const.default_tags
-    actual_tags = []
-    for h in tags_list:
-        for t in tags_list[h]:
-            if t not in possible_tags and t not in actual_tags:
-                actual_tags.append(t)
+    actual_tags = [t for t, names in get_tag_index().items() if names and t not in possible_tags]
     possible_tags += sorted(actual_tags)
     return possible_tags
 
@@ -2100,8 +3238,8 @@ def update_offline_mode(self, context):
     set_persistent_setting("offline_mode", prefs.offline_mode)
 
 
-def get_hdri_haven_list(force_update=False):
-    """Get Poly Haven list from web once per week, otherwise fetch from file"""
+def read_hdri_haven_list(force_update=False):
+    """Return the Poly Haven list saved on disk, and whether it should be fetched from the web again"""
 
     offline_data = {}
     if os.path.exists(const.hdri_haven_list_path):
@@ -2115,72 +3253,125 @@ def get_hdri_haven_list(force_update=False):
 
     if (prefs and prefs.offline_mode) or get_persistent_setting("offline_mode"):
         print("Gaffer not fetching HDRIs from Poly Haven, offline mode enabled, using local data if available")
-        return offline_data
+        return offline_data, False
 
     if not force_update:
         if offline_data:
-            import time
-
             age = time.time() - os.stat(const.hdri_haven_list_path).st_mtime  # seconds since last modified
             if age / 60 / 60 / 24 < 7:
-                return offline_data
+                return offline_data, False
 
+    return offline_data, True
+
+
+def fetch_hdri_haven_list(offline_data, force_update=False):
+    """Download the Poly Haven list and save it to disk. Returns the list and whether it's new.
+    Doesn't use bpy, so it can run in a thread"""
     from requests import get as requests_get
     from requests.exceptions import RequestException, Timeout, HTTPError
 
     print("Getting HDRI list from Poly Haven...")
     try:
         hdrihaven_hdris = requests_get("https://hdrihaven.com/php/json_list.php", timeout=10).json()
-    except (RequestException, Timeout, HTTPError):
+    except (RequestException, Timeout, HTTPError, ValueError):
         if force_update:
             print("    Can't fetch list from Poly Haven")
-            return {}
+            return {}, False
         else:
             print("    Can't fetch list from Poly Haven, using old data")
-            if offline_data:
-                return offline_data
-            else:
+            if not offline_data:
                 print("    No old data either!")
-                return {}
-    else:
-        for h in hdrihaven_hdris:
-            # Convert comma separated list into actual list
-            hdrihaven_hdris[h] = hdrihaven_hdris[h].replace(";", ",").split(",")
-        with open(const.hdri_haven_list_path, "w") as f:
-            f.write(json.dumps(hdrihaven_hdris, indent=4))
-
-        # Add Poly Haven tags to tag list
-        standard_colors = [
-            "red",
-            "green",
-            "blue",
-            "yellow",
-            "orange",
-            "purple",
-            "pink",
-            "brown",
-            "black",
-            "gray",
-            "white",
-        ]
-        tag_list = get_tags()
-        for h in hdrihaven_hdris:
-            if h in const.hdri_list:
-                if h in tag_list:
-                    for t in hdrihaven_hdris[h]:
-                        if t not in tag_list[h]:
-                            if t not in standard_colors:
-                                tag_list[h].append(t)
-                else:
-                    tag_list[h] = [t for t in hdrihaven_hdris[h] if t not in standard_colors]
-        with open(const.tags_path, "w") as f:
-            f.write(json.dumps(tag_list, indent=4))
+            return offline_data, False
+
+    for h in hdrihaven_hdris:
+        # Convert comma separated list into actual list
+        hdrihaven_hdris[h] = hdrihaven_hdris[h].replace(";", ",").split(",")
+    write_json_atomic(const.hdri_haven_list_path, hdrihaven_hdris)
+    return hdrihaven_hdris, True
+
+
+def merge_hdri_haven_tags(hdrihaven_hdris):
+    """Add Poly Haven tags to tag list"""
+    standard_colors = [
+        "red",
+        "green",
+        "blue",
+        "yellow",
+        "orange",
+        "purple",
+        "pink",
+        "brown",
+        "black",
+        "gray",
+        "white",
+    ]
+    tag_list = get_tags()
+    for h in hdrihaven_hdris:
+        if h in const.hdri_list:
+            if h in tag_list:
+                for t in hdrihaven_hdris[h]:
+                    if t not in tag_list[h]:
+                        if t not in standard_colors:
+                            tag_list[h].append(t)
+            else:
+                tag_list[h] = [t for t in hdrihaven_hdris[h] if t not in standard_colors]
+    const.tag_index = {}  # Changed a lot at once, rebuild it from scratch
+    const.tags_version += 1
+    write_json_later(const.tags_path)
+
+
+def get_hdri_haven_list(force_update=False):
+    """Get Poly Haven list from web once per week, otherwise fetch from file"""
+    offline_data, needs_update = read_hdri_haven_list(force_update)
+    if not needs_update:
+        return offline_data
+
+    hdrihaven_hdris, is_new = fetch_hdri_haven_list(offline_data, force_update)
+    if is_new:
+        merge_hdri_haven_tags(hdrihaven_hdris)
+    return hdrihaven_hdris
+
+
+def update_hdri_haven_list(force_update=False):
+    """Like get_hdri_haven_list, but without waiting for the web: const.hdri_haven_list is set to the list on disk
+    right away, and updated by apply_hdri_haven_list once a background fetch is done"""
+    offline_data, needs_update = read_hdri_haven_list(force_update)
+    if offline_data:
+        const.hdri_haven_list = offline_data
+    if not needs_update or const.hdri_haven_fetch is not None:
+        return
 
-        return hdrihaven_hdris
+    import threading
 
+    fetch = {"done": False, "result": None}
 
-if len(const.hdri_haven_list) < 1:
-    const.hdri_haven_list = get_hdri_haven_list()
+    def run():
+        try:
+            fetch["result"] = fetch_hdri_haven_list(offline_data, force_update)
+        finally:
+            fetch["done"] = True
+
+    const.hdri_haven_fetch = fetch
+    threading.Thread(target=run, daemon=True).start()
+    bpy.app.timers.register(apply_hdri_haven_list, first_interval=0.5, persistent=True)
+
+
+def apply_hdri_haven_list():
+    """Timer that waits for the fetch started by update_hdri_haven_list, then uses its result on the main thread"""
+    fetch = const.hdri_haven_fetch
+    if fetch is None:
+        return None
+    if not fetch["done"]:
+        return 0.5
+
+    const.hdri_haven_fetch = None
+    if fetch["result"] is not None:
+        hdrihaven_hdris, is_new = fetch["result"]
+        if hdrihaven_hdris:
+            const.hdri_haven_list = hdrihaven_hdris
+        if is_new:
+            merge_hdri_haven_tags(hdrihaven_hdris)
+    return None
 
 
 def show_hdrihaven():
@@ -2204,6 +3395,7 @@ _force_redraw_hack.arg = dict(type="DRAW_WIN_SWAP", iterations=1)
 
 def progress_begin(context):
     context.scene.gaf_props.ShowProgress = True
+    context.scene.gaf_props.ProgressCancel = False
     _force_redraw_hack()
 
 
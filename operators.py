@@ -27,8 +27,7 @@ from mathutils import Vector, Matrix
 from bpy_extras.view3d_utils import location_3d_to_region_2d
 from bpy.app.handlers import persistent
 from bpy_extras.io_utils import ImportHelper
-from time import sleep
-from subprocess import run
+from time import sleep, monotonic
 
 from . import constants as const
 from . import functions as fn
@@ -52,6 +51,13 @@ def load_handler(dummy):
         bpy.types.SpaceView3D.draw_handler_remove(GAFFER_OT_show_light_label._handle, "WINDOW")
     bpy.context.scene.gaf_props.IsShowingRadius = False
     bpy.context.scene.gaf_props.IsShowingLabel = False
+    fn.invalidate_light_registry()
+    const.world_node_maps.clear()
+    const.hdri_graph_state.clear()
+    const.handler_images.clear()
+    const.proxy_images.clear()
+    const.proxy_swaps.clear()
+    fn.prepare_proxy_renders()  # Also before command line renders, e.g. blender -b file.blend -f 1
 
 
 class GAFFER_OT_rename(bpy.types.Operator):
@@ -336,14 +342,14 @@ class GAFFER_OT_solo(bpy.types.Operator):
         if showhide:  # Enter Solo mode
             fn.refresh_light_list(scene)
             scene.gaf_props.SoloActive = light
-            fn.getHiddenStatus(scene, fn.stringToNestedList(scene.gaf_props.Lights, True))
+            fn.getHiddenStatus(scene, fn.light_registry(scene)["lights"])
             for l in statelist:  # first check if lights still exist
                 if l[0] != "WorldEnviroLight":
                     try:
                         obj = bpy.data.objects[l[0]]
                     except KeyError:
                         # TODO not sure if this ever happens, if it does, doesn't it break?
-                        fn.getHiddenStatus(scene, fn.stringToNestedList(scene.gaf_props.Lights, True))
+                        fn.getHiddenStatus(scene, fn.light_registry(scene)["lights"])
                         bpy.ops.gaffer.solo()
                         # If one of the lights has been deleted/changed, update the list and dont restore visibility
                         return {"FINISHED"}
@@ -377,7 +383,7 @@ class GAFFER_OT_solo(bpy.types.Operator):
                     except KeyError:
                         # TODO not sure if this ever happens, if it does, doesn't it break?
                         fn.refresh_light_list(scene)
-                        fn.getHiddenStatus(scene, fn.stringToNestedList(scene.gaf_props.Lights, True))
+                        fn.getHiddenStatus(scene, fn.light_registry(scene)["lights"])
                         scene.gaf_props.SoloActive = oldlight
                         bpy.ops.gaffer.solo()
                         return {"FINISHED"}
@@ -442,6 +448,24 @@ class GAFFER_OT_refresh_light_list(bpy.types.Operator):
         return {"FINISHED"}
 
 
+class GAFFER_OT_lights_page(bpy.types.Operator):
+
+    "Show the next/previous page of lights"
+    bl_idname = "gaffer.lights_page"
+    bl_label = "Next/Previous Page"
+    bl_options = {"INTERNAL"}
+    do_next: bpy.props.BoolProperty()
+
+    def execute(self, context):
+        scene = context.scene
+        gaf_props = scene.gaf_props
+        records = fn.filter_light_records(scene, fn.light_draw_model(scene)["records"])
+        num_pages = fn.light_page_count(len(records))
+        page = min(gaf_props.LightsPage, num_pages - 1)
+        gaf_props.LightsPage = (page + (1 if self.do_next else -1)) % num_pages
+        return {"FINISHED"}
+
+
 class GAFFER_OT_set_light_data_user_names(bpy.types.Operator):
     """This light data is used by multiple objects.
     Click to set the data name to match the object names.
@@ -529,9 +553,7 @@ class GAFFER_OT_apply_exposure(bpy.types.Operator):
     def execute(self, context):
         scene = context.scene
         fn.refresh_light_list(scene)
-        gaf_props = scene.gaf_props
-        lights_str = gaf_props.Lights
-        lights = fn.stringToNestedList(lights_str)
+        lights = fn.light_registry(scene)["lights"]
 
         evs = scene.view_settings.exposure  # CM exposure is set in EVs/stops
         exposure = pow(2, evs)  # Linear exposure adjustment
@@ -544,7 +566,7 @@ class GAFFER_OT_apply_exposure(bpy.types.Operator):
         completed_lights = []
         for item in lights:
             if item[0] != "":
-                light = scene.objects[item[0][1:-1]]  # drop the apostrophes
+                light = scene.objects[item[0]]
                 if light.type == "LIGHT":
                     if light in completed_lights:
                         continue
@@ -552,27 +574,14 @@ class GAFFER_OT_apply_exposure(bpy.types.Operator):
                     completed_lights.append(light)
                 else:
                     use_nodes = True
-                    material = bpy.data.materials[item[1][1:-1]]
+                    material = bpy.data.materials[item[1]]
                     if material.use_nodes:
-                        node_strength = material.node_tree.nodes[item[2][1:-1]]
+                        node_strength = material.node_tree.nodes[item[2]]
                     else:
                         use_nodes = False
 
                     if use_nodes:
-                        if item[3].startswith("'"):
-                            socket_strength_str = str(item[3][1:-1])
-                        else:
-                            socket_strength_str = str(item[3])
-
-                        if socket_strength_str.startswith("o"):
-                            socket_strength_type = "o"
-                            socket_strength = int(socket_strength_str[1:])
-                        elif socket_strength_str.startswith("i"):
-                            socket_strength_type = "i"
-                            socket_strength = int(socket_strength_str[1:])
-                        else:
-                            socket_strength_type = "i"
-                            socket_strength = int(socket_strength_str)
+                        socket_strength_type, socket_strength = fn.split_socket(item[3])
 
                         strength_sockets = node_strength.inputs
                         if socket_strength_type == "o":
@@ -1492,6 +1501,7 @@ class GAFFER_OT_hdri_thumb_gen(bpy.types.Operator):
     bl_options = {"INTERNAL"}
 
     size_limit = 100
+    use_subprocess = False  # Render all thumbnails with resize.py in background Blender processes
 
     skip_huge_files: bpy.props.BoolProperty(
         name="Skip files larger than " + str(size_limit) + " MB to save time (recommended).",
@@ -1514,8 +1524,7 @@ class GAFFER_OT_hdri_thumb_gen(bpy.types.Operator):
 
         col = layout.column()
         col.label(text="This may take a few minutes, but only has to be done once.")
-        col.label(text="The only way to stop this process once you start it is to forcibly close Blender.")
-        col.label(text="Blender may become unresponsive during this process.")
+        col.label(text="You can keep working meanwhile, and cancel it with the Cancel button on the progress bar.")
 
         col.separator()
         col = layout.column(align=True)
@@ -1526,6 +1535,10 @@ class GAFFER_OT_hdri_thumb_gen(bpy.types.Operator):
             col.label(text="You may wish to disable 'Skip big files', but first read its tooltip.")
 
     def generate_thumb(self, name, files):
+        """Make the thumbnail of an HDRI unless it's up to date, or return a job for resize.py if it can't be"""
+        if fn.get_thumbnail(name) is not None:
+            return None
+
         chosen_file = ""
 
         # Check if thumb file came with HDRI
@@ -1538,111 +1551,129 @@ class GAFFER_OT_hdri_thumb_gen(bpy.types.Operator):
                 chosen_file = os.path.join(d, f)
                 break
 
+        info = fn.get_variation_info()
         if not chosen_file:
             if len(files) == 1:
                 chosen_file = files[0]
             else:
-                # First check if there are really small versions
-                small_sizes = ["256p", "512p"]
-                for f in files:
-                    for s in small_sizes:
-                        if s in f:
-                            chosen_file = f
-                            break
-                    if chosen_file:
-                        break
-
-                # Otherwise pick smallest file
-                if not chosen_file:
-                    file_sizes = {}
-                    for f in files:
-                        if os.path.splitext(f)[1].lower() in const.allowed_file_types:
-                            if not os.path.splitext(f)[0].lower().endswith("env"):
-                                file_sizes[f] = os.path.getsize(f)
-                    chosen_file = min(file_sizes, key=file_sizes.get)
+                # Pick the smallest variation that is still at least as wide as the thumbnail,
+                # or the smallest file when resolutions are unknown
+                candidates = [f for f in files if not os.path.splitext(f)[0].lower().endswith("env")] or files
+                resolutions = {f: info[f][2] for f in candidates if f in info and info[f][2]}
+                if len(resolutions) == len(candidates):
+                    big_enough = [f for f in candidates if resolutions[f][0] >= 200] or candidates
+                    chosen_file = min(big_enough, key=lambda f: resolutions[f][0])
+                else:
+                    chosen_file = min(candidates, key=lambda f: info[f][0] if f in info else os.path.getsize(f))
         if not chosen_file:
             chosen_file = files[0]  # Safety fallback
 
         # Create thumbnail
-        thumb_file = os.path.join(const.thumbnail_dir, name + "__thumb_preview.jpg")
-        if not os.path.exists(thumb_file):
-            filesize = os.path.getsize(chosen_file) / 1024 / 1024
-            fn.log(
-                "    " + name + ": " + chosen_file + "  " + str(ceil(filesize)) + " MB",
-                also_print=True,
-            )
+        thumb_file = fn.new_thumbnail_path(name)
+        filesize = (info[chosen_file][0] if chosen_file in info else os.path.getsize(chosen_file)) / 1024 / 1024
+        fn.log(
+            "    " + name + ": " + chosen_file + "  " + str(ceil(filesize)) + " MB",
+            also_print=True,
+        )
 
-            if filesize < self.size_limit or not self.skip_huge_files:
-                cmd = [bpy.app.binary_path]
-                cmd.append("--background")
-                cmd.append("--factory-startup")
-                cmd.append("--python")
-                cmd.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "resize.py"))
-                cmd.append("--")
-                cmd.append(chosen_file)
-                cmd.append("200")
-                cmd.append(thumb_file)
-                run(cmd)
-            else:
-                fn.log("    Too big", timestamp=False, also_print=True)
-                bpy.context.scene.gaf_props.ThumbnailsBigHDRIFound = True
+        if filesize < self.size_limit or not self.skip_huge_files:
+            if not self.use_subprocess:
+                try:
+                    fn.generate_thumbnail(chosen_file, thumb_file, 200)
+                    fn.set_thumbnail(name, thumb_file)
+                    return None
+                except Exception as e:
+                    fn.log("    Failed to generate in-process, using resize.py: " + str(e), also_print=True)
+            self._job_names[thumb_file] = name
+            return [chosen_file, 200, thumb_file]
+        else:
+            fn.log("    Too big", timestamp=False, also_print=True)
+            bpy.context.scene.gaf_props.ThumbnailsBigHDRIFound = True
+        return None
 
-    def execute(self, context):
-        fn.log("OP: Generate Thumbnails")
-        if not self.skip_huge_files:
-            fn.log("Large files included", timestamp=False)
+    def finish(self, context, cancelled=False):
+        context.window_manager.event_timer_remove(self._timer)
+        fn.stop_resize_workers(self._executor, self._processes)
 
-        context.preferences.addons[__package__].preferences.RequestThumbGen = False
-        hdris = fn.get_hdri_list()
+        for job in self._jobs:
+            if os.path.exists(job[2]):  # Made by resize.py
+                fn.set_thumbnail(self._job_names[job[2]], job[2])
+        fn.gc_thumbnails()
 
-        fn.progress_begin(context)
+        fn.progress_end(context)
+        if cancelled:
+            fn.log("Cancelled generating thumbnails", also_print=True)
+        else:
+            fn.log("Successfully finished generating thumbnails")
+        fn.refresh_previews()
+        return {"CANCELLED"} if cancelled else {"FINISHED"}
 
-        num_hdris = len(hdris)
-        threaded = True  # Set to False for debugging
+    def modal(self, context, event):
+        if context.scene.gaf_props.ProgressCancel:  # Cancel button, Esc may be meant for something else
+            return self.finish(context, cancelled=True)
+        if event.type != "TIMER":
+            return {"PASS_THROUGH"}
 
-        errors = []
-        if threaded:
-            from concurrent.futures import ThreadPoolExecutor
+        num_hdris = len(self._hdris)
+        if self._index < num_hdris:
+            # Work in short slices so Blender stays responsive
+            start = monotonic()
+            while self._index < num_hdris and monotonic() - start < 0.1:
+                h, files = self._hdris[self._index]
+                job = self.generate_thumb(h, files)
+                if job:
+                    self._jobs.append(job)
+                self._index += 1
+            fn.progress_update(
+                context,
+                self._index / num_hdris,
+                "Generating thumbnail: " + str(self._index) + "/" + str(num_hdris),
+            )
+            if self._index == num_hdris and self._jobs:
+                fn.log("Rendering " + str(len(self._jobs)) + " thumbnails with resize.py", also_print=True)
+                self._executor, self._futures = fn.start_resize_workers(
+                    self._jobs, self._processes, max_workers=8 if self.skip_huge_files else 4
+                )
+            return {"PASS_THROUGH"}
 
-            executor = ThreadPoolExecutor(max_workers=8 if self.skip_huge_files else 4)
-            threads = []
-            for i, h in enumerate(hdris):
-                t = executor.submit(self.generate_thumb, h, hdris[h])
-                threads.append(t)
+        if self._futures:
+            from concurrent.futures import wait
 
-            while any(t._state != "FINISHED" for t in threads):
-                num_finished = 0
-                for tt in threads:
-                    if tt._state == "FINISHED":
-                        num_finished += 1
-                        if tt.result() is not None:
-                            errors.append(tt.result())
-                fn.progress_update(
-                    context,
-                    num_finished / num_hdris,
-                    "Generating thumbnail: " + str(num_finished + 1) + "/" + str(num_hdris),
-                )
-                sleep(2)
-        else:
-            for num_finished, h in enumerate(hdris):
-                self.generate_thumb(h, hdris[h])
-                fn.progress_update(
-                    context,
-                    num_finished / num_hdris,
-                    "Generating thumbnail: " + str(num_finished + 1) + "/" + str(num_hdris),
-                )
+            done, not_done = wait(self._futures, timeout=0)
+            fn.progress_update(
+                context,
+                len(done) / len(self._futures),
+                "Rendering thumbnails with resize.py: " + str(len(done)) + "/" + str(len(self._futures)),
+            )
+            if not_done:
+                return {"PASS_THROUGH"}
+            for future in done:
+                if future.exception() is not None:
+                    print(future.exception())
 
-        if errors:
-            for e in errors:
-                print(e)
+        return self.finish(context)
 
-        fn.progress_end(context)
+    def execute(self, context):
+        fn.log("OP: Generate Thumbnails")
+        if not self.skip_huge_files:
+            fn.log("Large files included", timestamp=False)
 
-        fn.log("Successfully finished generating thumbnails")
+        context.preferences.addons[__package__].preferences.RequestThumbGen = False
+        hdris = fn.get_hdri_list()
+        self._hdris = list(hdris.items())
+        self._index = 0
+        self._jobs = []  # Thumbnails left for resize.py
+        self._job_names = {}  # Thumbnail file -> HDRI name
+        self._executor = None
+        self._futures = []
+        self._processes = []
 
-        fn.refresh_previews()
+        fn.progress_begin(context)
 
-        return {"FINISHED"}
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(0.05, window=context.window)
+        wm.modal_handler_add(self)
+        return {"RUNNING_MODAL"}
 
     def invoke(self, context, event):
         return context.window_manager.invoke_props_dialog(self, width=round(420 * fn.dpifac()))
@@ -1655,23 +1686,64 @@ class GAFFER_OT_hdri_jpg_gen(bpy.types.Operator):
     bl_label = "Generate JPGs"
     bl_options = {"INTERNAL"}
 
-    def generate_jpgs(self, context, name):
+    @staticmethod
+    def outdated_jpgs(name):
+        """Return the HDRI file to make the JPGs from, and the paths of its normal and darkened JPG,
+        or None for those that already exist and are newer than the HDRI"""
         fp = fn.get_variation(name, mode="biggest")
-
-        img_exists = False
-        for m in [
-            "",
-            "_dark",
-        ]:  # Run twice, once for normal JPG and once for darkened JPG
+        hdri_mtime = os.path.getmtime(fp) if os.path.exists(fp) else 0
+        paths = []
+        for m in ("", "_dark"):
             jpg_path = os.path.join(const.jpg_dir, name + m + ".jpg")
-            if not os.path.exists(jpg_path):
-                if not img_exists:
-                    img = bpy.data.images.load(fp, check_existing=False)
-                    img_exists = True
-                darkened = m == "_dark"
-                fn.save_image(context, img, jpg_path, "JPEG", -4 if darkened else 0)
-        if img_exists:
-            bpy.data.images.remove(img)
+            up_to_date = os.path.exists(jpg_path) and os.path.getmtime(jpg_path) >= hdri_mtime
+            paths.append(None if up_to_date else jpg_path)
+        return fp, paths
+
+    def generate_jpgs(self, context, name):
+        fp, missing = self.outdated_jpgs(name)
+        if not any(missing):
+            return
+
+        try:
+            fn.generate_background_jpgs(fp, *missing, context.scene.world.gaf_hdri_props.hdri_jpg_max_width)
+            return
+        except Exception as e:
+            fn.log("    Failed to generate JPGs directly, rendering them instead: " + str(e), also_print=True)
+
+        img = bpy.data.images.load(fp, check_existing=False)
+        for path, exposure in zip(missing, (0, -4)):
+            if path:
+                fn.save_image(context, img, path, "JPEG", exposure)
+        bpy.data.images.remove(img)
+
+    def finish(self, context, cancelled=False):
+        context.window_manager.event_timer_remove(self._timer)
+        fn.stop_resize_workers(self._executor, self._processes)
+        fn.progress_end(context)
+        print("Cancelled" if cancelled else "Done!")
+        fn.setup_hdri(self, context)
+        return {"CANCELLED"} if cancelled else {"FINISHED"}
+
+    def modal(self, context, event):
+        if context.scene.gaf_props.ProgressCancel:  # Cancel button, Esc may be meant for something else
+            return self.finish(context, cancelled=True)
+        if event.type != "TIMER":
+            return {"PASS_THROUGH"}
+
+        from concurrent.futures import wait
+
+        done, not_done = wait(self._futures, timeout=0)
+        fn.progress_update(
+            context,
+            len(done) / len(self._futures),
+            "Generating JPGs: " + str(len(done)) + "/" + str(len(self._futures)),
+        )
+        if not_done:
+            return {"PASS_THROUGH"}
+        for future in done:
+            if future.exception() is not None:
+                print(future.exception())
+        return self.finish(context)
 
     def execute(self, context):
         gaf_props = context.scene.gaf_props
@@ -1680,19 +1752,23 @@ class GAFFER_OT_hdri_jpg_gen(bpy.types.Operator):
         gen_all = gaf_hdri_props.hdri_jpg_gen_all
 
         if gen_all:
-            hdris = fn.get_hdri_list()
-            num_hdris = len(hdris)
-            fn.progress_begin(context)
-            for i, hdri in enumerate(hdris):
-                fn.progress_update(
-                    context,
-                    i / num_hdris,
-                    "Generating JPG: " + str(i + 1) + "/" + str(num_hdris),
-                )
-                print("(" + str(i + 1) + "/" + str(num_hdris) + ") Generating JPG for " + hdri + " ...")
-                self.generate_jpgs(context, hdri)
-            print("Done!")
-            fn.progress_end(context)
+            # Render all outdated JPGs with resize.py, spread over as many background Blenders as fit in memory
+            jobs = []
+            for name in fn.get_hdri_list():
+                fp, missing = self.outdated_jpgs(name)
+                for path, exposure in zip(missing, (0, -4)):
+                    if path:
+                        jobs.append([fp, gaf_hdri_props.hdri_jpg_max_width, path, exposure])
+            if jobs:
+                fn.log("Generating " + str(len(jobs)) + " JPGs with resize.py", also_print=True)
+                self._processes = []
+                max_workers = fn.resize_worker_limit({job[0] for job in jobs})
+                self._executor, self._futures = fn.start_resize_workers(jobs, self._processes, max_workers)
+                fn.progress_begin(context)
+                wm = context.window_manager
+                self._timer = wm.event_timer_add(0.1, window=context.window)
+                wm.modal_handler_add(self)
+                return {"RUNNING_MODAL"}
         else:
             self.generate_jpgs(context, gaf_hdri_props.hdri)
 
@@ -1701,6 +1777,18 @@ class GAFFER_OT_hdri_jpg_gen(bpy.types.Operator):
         return {"FINISHED"}
 
 
+class GAFFER_OT_cancel_progress(bpy.types.Operator):
+
+    "Stop the task in progress, anything already finished is kept"
+    bl_idname = "gaffer.cancel_progress"
+    bl_label = "Cancel"
+    bl_options = {"INTERNAL"}
+
+    def execute(self, context):
+        context.scene.gaf_props.ProgressCancel = True
+        return {"FINISHED"}
+
+
 class GAFFER_OT_hdri_clear_search(bpy.types.Operator):
 
     "Clear the search, show all HDRIs"
@@ -1751,10 +1839,10 @@ class GAFFER_OT_hdri_paddles(bpy.types.Operator):
 
     def execute(self, context):
         gaf_hdri_props = context.scene.world.gaf_hdri_props
-        hdris = fn.get_hdri_list(use_search=True)
+        results = fn.get_hdri_search_results()
         current_hdri = gaf_hdri_props.hdri
         current_index = -1
-        list_hdris = list(hdris)
+        list_hdris = results["names"]
         first_hdri = list_hdris[0]
         last_hdri = list_hdris[-1]
 
@@ -1765,7 +1853,7 @@ class GAFFER_OT_hdri_paddles(bpy.types.Operator):
             gaf_hdri_props.hdri = last_hdri
             return {"FINISHED"}
         else:
-            current_index = list_hdris.index(current_hdri)
+            current_index = results["index"][current_hdri]
             gaf_hdri_props.hdri = list_hdris[current_index + 1] if self.do_next else list_hdris[current_index - 1]
             return {"FINISHED"}
 
@@ -1823,7 +1911,7 @@ class GAFFER_OT_hdri_random(bpy.types.Operator):
 
         random_hdri = gaf_hdri_props.hdri
         while random_hdri == gaf_hdri_props.hdri:  # ensure the same HDRI is not chosen twice in a row
-            random_hdri = choice(list(hdris))
+            random_hdri = choice(fn.get_hdri_search_results()["names"])
 
         gaf_hdri_props.hdri = random_hdri
 
@@ -2113,6 +2201,7 @@ class GAFFER_OT_debug_delete_thumbs(bpy.types.Operator):
             for f in files:
                 p = os.path.join(const.thumbnail_dir, f)
                 os.remove(p)
+            fn.reset_thumbnail_index()
             self.report({"INFO"}, "Deleted %s files" % len(files))
             return {"FINISHED"}
         else:
@@ -20,18 +20,29 @@
 # img input path
 # size X
 # img output path
+# or, to resize many images with one Blender process:
+# --manifest
+# path to a JSON file containing a list of [img input path, size X, img output path]
+# or [img input path, size X, img output path, exposure] to save a color managed JPG at the given exposure,
+# where size X can be 0 to keep the original size
 
 # example usage:
 # blender --background --factory-startup --python resize.py -- "C:\big image.hdr" 200 "C:\small image.jpg"
+# blender --background --factory-startup --python resize.py -- --manifest "C:\jobs.json"
 
 import bpy
 import sys
+import json
 from math import floor
 
 argv = sys.argv
 argv = argv[argv.index("--") + 1 :]  # Get all args after  '--'
-FILEPATH, SIZE_X, OUTPATH = argv
-SIZE_X = int(SIZE_X)
+if argv[0] == "--manifest":
+    with open(argv[1]) as f:
+        JOBS = json.load(f)
+else:
+    FILEPATH, SIZE_X, OUTPATH = argv
+    JOBS = [[FILEPATH, SIZE_X, OUTPATH]]
 
 context = bpy.context
 scene = context.scene
@@ -47,14 +58,10 @@ for n in node_tree.nodes:
     else:
         n_comp = n
 
-img = bpy.data.images.load(FILEPATH)
 n_img = node_tree.nodes.new("CompositorNodeImage")
-n_img.image = img
 
 n_blur = node_tree.nodes.new("CompositorNodeBlur")
 n_blur.filter_type = "FLAT"
-n_blur.size_x = floor(img.size[0] / SIZE_X / 2)
-n_blur.size_y = n_blur.size_x
 
 n_scale = node_tree.nodes.new("CompositorNodeScale")
 n_scale.space = "RENDER_SIZE"
@@ -66,14 +73,44 @@ links.new(n_img.outputs[0], n_blur.inputs[0])
 links.new(n_blur.outputs[0], n_scale.inputs[0])
 links.new(n_scale.outputs[0], n_comp.inputs[0])
 
-# Render
 r = scene.render
 r.image_settings.file_format = "JPEG"
 r.image_settings.quality = 95
-r.resolution_x = SIZE_X
-SIZE_Y = floor(SIZE_X / (img.size[0] / img.size[1]))
-r.resolution_y = SIZE_Y
 r.resolution_percentage = 100
-r.filepath = OUTPATH
 
-bpy.ops.render.render(write_still=True)
+# The node tree is reused for every job, only the image changes
+img = None
+for job in JOBS:
+    FILEPATH, SIZE_X, OUTPATH = job[:3]
+    EXPOSURE = job[3] if len(job) > 3 else None
+    if img is None or img.filepath != FILEPATH:  # Consecutive jobs for the same image load it once
+        if img is not None:
+            n_img.image = None
+            bpy.data.images.remove(img)
+            img = None
+        try:
+            img = bpy.data.images.load(FILEPATH)
+        except RuntimeError as e:
+            print("Failed to load " + FILEPATH + ": " + str(e))
+            continue
+    n_img.image = img
+
+    SIZE_X = int(SIZE_X) or img.size[0]
+    SIZE_X = min(SIZE_X, img.size[0])
+    n_blur.size_x = floor(img.size[0] / SIZE_X / 2)
+    n_blur.size_y = n_blur.size_x
+
+    if EXPOSURE is not None:
+        vs = scene.view_settings
+        vs.view_transform = "Standard"
+        vs.look = "None"
+        vs.exposure = EXPOSURE
+        vs.gamma = 1
+
+    # Render
+    r.resolution_x = SIZE_X
+    SIZE_Y = floor(SIZE_X / (img.size[0] / img.size[1]))
+    r.resolution_y = SIZE_Y
+    r.filepath = OUTPATH
+
+    bpy.ops.render.render(write_still=True)
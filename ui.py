@@ -126,7 +126,22 @@ def draw_renderer_independant(gaf_props, row, light, icons, users=[None, 1]):
         solobtn.worldsolo = False
 
 
-def draw_cycles_eevee_UI(context, layout, lights):
+def draw_lights_pager(layout, gaf_props, prefs, num_lights, num_filtered):
+    """Draw the filter and page buttons when there are too many lights for one page, return the index of the first
+    light on the current page"""
+    num_pages = fn.light_page_count(num_filtered)
+    page = min(gaf_props.LightsPage, num_pages - 1)
+    if num_lights > prefs.lights_per_page or gaf_props.LightsFilter:
+        row = layout.row(align=True)
+        row.prop(gaf_props, "LightsFilter", text="", icon="VIEWZOOM")
+        if num_pages > 1:
+            row.operator(ops.GAFFER_OT_lights_page.bl_idname, text="", icon="TRIA_LEFT").do_next = False
+            row.label(text=f"{page + 1} / {num_pages}")
+            row.operator(ops.GAFFER_OT_lights_page.bl_idname, text="", icon="TRIA_RIGHT").do_next = True
+    return page * prefs.lights_per_page
+
+
+def draw_cycles_eevee_UI(context, layout):
     def draw_strength_cycles(col, light, material, node_strength, socket_strength_type, socket_strength):
         row = col.row(align=True)
         strength_sockets = node_strength.inputs
@@ -193,21 +208,9 @@ def draw_cycles_eevee_UI(context, layout, lights):
         op.socket_strength_type = ""
         op.increase = True
 
-    def draw_color_cycles(gaf_props, i, icons, col, row, light, material):
-        if light.type == "LIGHT":
-            nodes = light.data.node_tree.nodes
-        else:
-            nodes = material.node_tree.nodes
+    def draw_color_cycles(gaf_props, i, icons, col, row, light, material, node_color):
         socket_color = 0
-        node_color = None
-        emissions = []  # make a list of all linked Emission shaders, use the right-most one
-        for node in nodes:
-            if node.type == "EMISSION":
-                if node.outputs[0].is_linked:
-                    emissions.append(node)
-        if emissions:
-            node_color = sorted(emissions, key=lambda x: x.location.x, reverse=True)[0]
-
+        if node_color:
             if not node_color.inputs[socket_color].is_linked:
                 subcol = row.column(align=True)
                 subrow = subcol.row(align=True)
@@ -618,113 +621,42 @@ def draw_cycles_eevee_UI(context, layout, lights):
     prefs = context.preferences.addons[__package__].preferences
     icons = fn.get_icons()
 
-    lights_to_show = []
-    # Check validity of list and make list of lights to display
-    vis_cols = fn.visibleCollections()
-    for light in lights:
-        try:
-            if light[0]:
-                # Will cause KeyError exception if obj no longer exists
-                a = bpy.data.objects[light[0][1:-1]]
-                if (gaf_props.VisibleLightsOnly and not a.hide_viewport) or (not gaf_props.VisibleLightsOnly):
-                    if a.type != "LIGHT":
-                        b = bpy.data.materials[light[1][1:-1]]
-                        if b.use_nodes:
-                            b.node_tree.nodes[light[2][1:-1]]
-                    else:
-                        if a.data.use_nodes:
-                            a.data.node_tree.nodes[light[2][1:-1]]
-                    if (gaf_props.VisibleCollectionsOnly and fn.isInVisibleCollection(a, vis_cols)) or (
-                        not gaf_props.VisibleCollectionsOnly
-                    ):
-                        if a.name not in [o.name for o in gaf_props.Blacklist]:
-                            lights_to_show.append(light)
-        except KeyError:
-            box = maincol.box()
-            row = box.row(align=True)
-            row.label(text="Light list out of date")
-            fn.tag_refresh_light_list()  # We can't refresh the list here, so we tag it for the next depsgraph update
-            row.operator(ops.GAFFER_OT_refresh_light_list.bl_idname, icon="FILE_REFRESH", text="")
-
-    # Don't show lights that share the same data
-    duplicates = {}
-    """
-    duplicates:
-        A dict with the key: object type + data name (cannot use only the name in case of conflicts).
-        The values are the number of duplicates for that key.
-    """
-    templist = []
-    for item in lights_to_show:
-        light = scene.objects[item[0][1:-1]]  # drop the apostrophes
-        if light.type == "LIGHT":
-            if ("LIGHT" + light.data.name) in duplicates:
-                duplicates["LIGHT" + light.data.name] += 1
-            else:
-                templist.append(item)
-                duplicates["LIGHT" + light.data.name] = 1
-        else:
-            mat = bpy.data.materials[item[1][1:-1]]
-            if ("MAT" + mat.name) in duplicates:
-                duplicates["MAT" + mat.name] += 1
-            else:
-                templist.append(item)
-                duplicates["MAT" + mat.name] = 1
-    lights_to_show = templist
-
-    i = 0
-    for item in lights_to_show:
-        light = scene.objects[item[0][1:-1]]  # drop the apostrophes
-        light_uses_nodes = True
-        is_portal = False
-        if light.type == "LIGHT":
-            material = None
-            if light.data.use_nodes:
-                node_strength = light.data.node_tree.nodes[item[2][1:-1]]
-            else:
-                light_uses_nodes = False
-
-            if light.data.type == "AREA" and light.data.cycles.is_portal and scene.render.engine == "CYCLES":
-                is_portal = True
-        else:
-            material = bpy.data.materials[item[1][1:-1]]
-            if material.use_nodes:
-                node_strength = material.node_tree.nodes[item[2][1:-1]]
-            else:
-                light_uses_nodes = False
-
-        if light.type == "LIGHT":
-            users = ["LIGHT" + light.data.name, duplicates["LIGHT" + light.data.name]]
-        else:
-            users = ["MAT" + material.name, duplicates["MAT" + material.name]]
-
-        if light_uses_nodes and scene.render.engine == "CYCLES":
+    model = fn.light_draw_model(scene)
+    if model["out_of_date"]:
+        box = maincol.box()
+        row = box.row(align=True)
+        row.label(text="Light list out of date")
+        fn.tag_refresh_light_list()  # We can't refresh the list here, so we tag it for the next depsgraph update
+        row.operator(ops.GAFFER_OT_refresh_light_list.bl_idname, icon="FILE_REFRESH", text="")
+
+    # Only lay out one page of lights, large scenes would make the panel unusable otherwise
+    records = fn.filter_light_records(scene, model["records"])
+    start = draw_lights_pager(maincol, gaf_props, prefs, len(model["records"]), len(records))
+    lights_to_show = records[start : start + prefs.lights_per_page]
+
+    i = start  # Index across all pages, used by the color temperature presets
+    for record in lights_to_show:
+        light = record["object"]
+        material = record["material"]
+        node_strength = record["node_strength"]
+        is_portal = record["is_portal"]
+        users = record["users"]
+
+        if record["uses_nodes"] and scene.render.engine == "CYCLES":
             box = maincol.box()
             rowmain = box.row()
             split = rowmain.split()
             col = split.column()
             row = col.row(align=True)
 
-            if item[3].startswith("'"):
-                socket_strength_str = str(item[3][1:-1])
-            else:
-                socket_strength_str = str(item[3])
-
-            if socket_strength_str.startswith("o"):
-                socket_strength_type = "o"
-                socket_strength = int(socket_strength_str[1:])
-            elif socket_strength_str.startswith("i"):
-                socket_strength_type = "i"
-                socket_strength = int(socket_strength_str[1:])
-            else:
-                socket_strength_type = "i"
-                socket_strength = int(socket_strength_str)
-
             draw_renderer_independant(gaf_props, row, light, icons, users)
 
             if not is_portal:
-                draw_strength_cycles(col, light, material, node_strength, socket_strength_type, socket_strength)
+                draw_strength_cycles(
+                    col, light, material, node_strength, record["socket_type"], record["socket_index"]
+                )
 
-                draw_color_cycles(gaf_props, i, icons, col, row, light, material)
+                draw_color_cycles(gaf_props, i, icons, col, row, light, material, record["node_color"])
 
             if "_Light:_(" + light.name + ")_" in gaf_props.MoreExpand or gaf_props.MoreExpandAll:
                 draw_more_options_cycles(box, scene, light, material, node_strength, is_portal)
@@ -775,7 +707,7 @@ def draw_unsupported_renderer_UI(context, layout, lights):
         try:
             if light[0]:
                 # Will cause KeyError exception if obj no longer exists
-                a = bpy.data.objects[light[0][1:-1]]
+                a = bpy.data.objects[light[0]]
                 if (gaf_props.VisibleLightsOnly and not a.hide_viewport) or (not gaf_props.VisibleLightsOnly):
                     if (gaf_props.VisibleCollectionsOnly and fn.isInVisibleCollection(a, vis_cols)) or (
                         not gaf_props.VisibleCollectionsOnly
@@ -797,18 +729,27 @@ def draw_unsupported_renderer_UI(context, layout, lights):
     """
     templist = []
     for item in lights_to_show:
-        light = scene.objects[item[0][1:-1]]  # drop the apostrophes
+        light = scene.objects[item[0]]
         if light.type == "LIGHT":
             if ("LIGHT" + light.data.name) in duplicates:
                 duplicates["LIGHT" + light.data.name] += 1
             else:
                 templist.append(item)
                 duplicates["LIGHT" + light.data.name] = 1
-    lights_to_show = templist
 
-    i = 0
+    # Only lay out one page of lights, like draw_cycles_eevee_UI
+    text = gaf_props.LightsFilter.lower()
+    filtered = [
+        item
+        for item in templist
+        if text in item[0].lower() or text in scene.objects[item[0]].data.name.lower()
+    ]
+    start = draw_lights_pager(maincol, gaf_props, prefs, len(templist), len(filtered))
+    lights_to_show = filtered[start : start + prefs.lights_per_page]
+
+    i = start
     for item in lights_to_show:
-        light = scene.objects[item[0][1:-1]]  # drop the apostrophes
+        light = scene.objects[item[0]]
 
         box = maincol.box()
         rowmain = box.row()
@@ -874,8 +815,9 @@ class GAFFER_PT_lights(bpy.types.Panel):
 
         scene = context.scene
         gaf_props = scene.gaf_props
-        lights_str = gaf_props.Lights
-        lights = fn.stringToNestedList(lights_str)
+        lights = fn.light_registry(scene)["lights"]
+        if not lights and gaf_props.Lights:
+            fn.tag_refresh_light_list()  # Convert the light list of a file saved with an older version
         layout = self.layout
         col = layout.column(align=True)
 
@@ -927,9 +869,9 @@ class GAFFER_PT_lights(bpy.types.Panel):
             row.operator(ops.GAFFER_OT_apply_exposure.bl_idname, text="", icon="CHECKBOX_HLT")
 
         if scene.render.engine == "CYCLES":
-            draw_cycles_eevee_UI(context, layout, lights)
+            draw_cycles_eevee_UI(context, layout)
         elif scene.render.engine in ["BLENDER_EEVEE", "BLENDER_EEVEE_NEXT"]:
-            draw_cycles_eevee_UI(context, layout, lights)
+            draw_cycles_eevee_UI(context, layout)
         else:
             draw_unsupported_renderer_UI(context, layout, lights)
             box = layout.box()
@@ -1075,7 +1017,7 @@ def draw_progress_bar(gaf_props, layout):
         r.label(text="")
         c = b.column(align=True)
         c.label(text="Large HDRI files may take a while")
-        c.label(text="You can stop this any time by closing Blender")
+        c.operator(ops.GAFFER_OT_cancel_progress.bl_idname, icon="CANCEL")
         layout.separator()
 
 
@@ -1198,6 +1140,7 @@ def draw_hdri_handler(context, layout, gaf_props, gaf_hdri_props, hdri_paths, pr
             vp_icon = "TRIA_LEFT" if gaf_hdri_props["hdri_variation"] != 0 else "TRIA_LEFT_BAR"
             row.operator(ops.GAFFER_OT_hdri_variation_paddles.bl_idname, text="", icon=vp_icon).do_next = False
             row.prop(gaf_hdri_props, "hdri_variation", text="")
+            row.prop(gaf_hdri_props, "hdri_use_proxy", text="", icon="RESTRICT_RENDER_OFF")
             if const.hdri_haven_list and const.hdri_list:
                 if gaf_hdri_props.hdri in const.hdri_haven_list and gaf_hdri_props.hdri in const.hdri_list:
                     if not any(("_16k" in h or "_8k" in h) for h in const.hdri_list[gaf_hdri_props.hdri]):
@@ -1374,10 +1317,10 @@ def draw_hdri_handler(context, layout, gaf_props, gaf_hdri_props, hdri_paths, pr
                     col.label(text="please click 'Generate JPGs' below.")
                     col.label(text="Note: This may take a while for high-res images")
                     col.operator(ops.GAFFER_OT_hdri_jpg_gen.bl_idname)
+                    col.prop(gaf_hdri_props, "hdri_jpg_max_width")
                     col.prop(gaf_hdri_props, "hdri_jpg_gen_all")
                     if gaf_hdri_props.hdri_jpg_gen_all:
                         col.label(text="This is REALLY going to take a while.")
-                        col.label(text="See the console for progress.")
                     col.separator()
     elif gaf_hdri_props.hdri_search or gaf_hdri_props.hdri_favorite or gaf_hdri_props.hdri_folder_filter:
         prefs.ForcePreviewsRefresh = True
@@ -1494,7 +1437,6 @@ class GAFFER_MT_folder_filter(bpy.types.Menu):
 
 def gaffer_node_menu_func(self, context):
     if context.space_data.node_tree.type == "SHADER" and context.space_data.shader_type == "OBJECT":
-        light_dict = fn.dictOfLights()
-        if context.object.name in light_dict:
+        if context.object.name in fn.light_registry(context.scene)["by_object"]:
             layout = self.layout
             layout.operator(ops.GAFFER_OT_node_set_strength.bl_idname)